@@ -0,0 +1,36 @@
+"""
+Add the file_blob table and the order_file.blob_id column
+
+New databases get these from db.create_all(); this script adds them to
+existing SQLite or PostgreSQL databases. It is safe to run more than once.
+Files uploaded before the upgrade have no blob and are deleted as before.
+"""
+import logging
+from sqlalchemy import inspect, text
+from app import app, db
+from models import OrderFile, FileBlob
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def add_file_blob_table():
+    """Create file_blob and add order_file.blob_id if they do not exist"""
+    with app.app_context():
+        FileBlob.__table__.create(bind=db.engine, checkfirst=True)
+        logger.info("Table file_blob is in place")
+        
+        columns = [column['name'] for column in inspect(db.engine).get_columns('order_file')]
+        if 'blob_id' in columns:
+            logger.info("blob_id column already exists in order_file table")
+        else:
+            with db.engine.begin() as connection:
+                connection.execute(text("ALTER TABLE order_file ADD COLUMN blob_id INTEGER REFERENCES file_blob (id)"))
+            logger.info("Added blob_id column to order_file table")
+        
+        for index in OrderFile.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            logger.info(f"Index {index.name} is in place")
+    return True
+
+if __name__ == "__main__":
+    add_file_blob_table()
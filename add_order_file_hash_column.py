@@ -0,0 +1,33 @@
+"""
+Add the content_hash column to the order_file table
+
+New databases get it from db.create_all(); this script adds the column and
+its index to existing SQLite or PostgreSQL databases. It is safe to run more
+than once. Files uploaded before the upgrade keep an empty content_hash.
+"""
+import logging
+from sqlalchemy import inspect, text
+from app import app, db
+from models import OrderFile
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def add_order_file_hash_column():
+    """Add order_file.content_hash and its index if they do not exist"""
+    with app.app_context():
+        columns = [column['name'] for column in inspect(db.engine).get_columns('order_file')]
+        if 'content_hash' in columns:
+            logger.info("content_hash column already exists in order_file table")
+        else:
+            with db.engine.begin() as connection:
+                connection.execute(text("ALTER TABLE order_file ADD COLUMN content_hash VARCHAR(64)"))
+            logger.info("Added content_hash column to order_file table")
+        
+        for index in OrderFile.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            logger.info(f"Index {index.name} is in place")
+    return True
+
+if __name__ == "__main__":
+    add_order_file_hash_column()
@@ -0,0 +1,26 @@
+"""
+Add the reporting and order list indexes to the order table
+
+New databases get these from db.create_all(); this script adds them to
+existing SQLite or PostgreSQL databases. It is safe to run more than once.
+
+- ix_order_payment_status_due_date: accounts receivable aging
+- ix_order_created_at_id: keyset pagination of the order list
+"""
+import logging
+from app import app, db
+from models import Order
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def add_order_indexes():
+    """Create every index declared on the Order model if it does not exist"""
+    with app.app_context():
+        for index in Order.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            logger.info(f"Index {index.name} is in place")
+    return True
+
+if __name__ == "__main__":
+    add_order_indexes()
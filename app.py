@@ -42,6 +42,27 @@ app.config["NEXTCLOUD_URL"] = os.environ.get("NEXTCLOUD_URL", "")
 app.config["NEXTCLOUD_USERNAME"] = os.environ.get("NEXTCLOUD_USERNAME", "")
 app.config["NEXTCLOUD_PASSWORD"] = os.environ.get("NEXTCLOUD_PASSWORD", "")
 app.config["NEXTCLOUD_FOLDER"] = os.environ.get("NEXTCLOUD_FOLDER", "print_orders")
+# Keep-alive connection pool per worker (match its thread count) and timeouts in seconds
+app.config["NEXTCLOUD_POOL_SIZE"] = int(os.environ.get("NEXTCLOUD_POOL_SIZE", "10"))
+app.config["NEXTCLOUD_CONNECT_TIMEOUT"] = float(os.environ.get("NEXTCLOUD_CONNECT_TIMEOUT", "5"))
+app.config["NEXTCLOUD_TIMEOUTS"] = {
+    operation: float(os.environ[f"NEXTCLOUD_{operation.upper()}_TIMEOUT"])
+    for operation in ("metadata", "list", "upload", "download", "delete", "assemble")
+    if os.environ.get(f"NEXTCLOUD_{operation.upper()}_TIMEOUT")
+}
+# Files larger than one chunk (bytes) use parallel chunked uploads
+app.config["NEXTCLOUD_CHUNK_SIZE"] = int(os.environ.get("NEXTCLOUD_CHUNK_SIZE", str(10 * 1024 * 1024)))
+app.config["NEXTCLOUD_CHUNK_WORKERS"] = int(os.environ.get("NEXTCLOUD_CHUNK_WORKERS", "4"))
+# Seconds a folder seen on Nextcloud is trusted to exist before checking it again
+app.config["NEXTCLOUD_FOLDER_CACHE_TTL"] = int(os.environ.get("NEXTCLOUD_FOLDER_CACHE_TTL", "300"))
+
+# Generated order and quote PDFs are cached on local disk up to this many bytes (0 disables)
+app.config["PDF_CACHE_DIR"] = os.environ.get("PDF_CACHE_DIR", os.path.join(app.instance_path, "pdf_cache"))
+app.config["PDF_CACHE_MAX_BYTES"] = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Processes laying out a batch-printed PDF; each app process runs one batch at a time
+app.config["PDF_BATCH_WORKERS"] = int(os.environ.get("PDF_BATCH_WORKERS", "2"))
+# Batch print job status and finished PDFs, shared by every app process
+app.config["PDF_BATCH_DIR"] = os.environ.get("PDF_BATCH_DIR", os.path.join(app.instance_path, "pdf_batches"))
 
 # Set base URL for link generation
 app.config["BASE_URL"] = os.environ.get("BASE_URL", "http://localhost:5000")
@@ -69,6 +90,12 @@ with app.app_context():
     # Create database tables
     db.create_all()
     
+    # Keep the daily revenue/cost rollup in step with order changes
+    import daily_rollup
+    
+    # Version the pricing tables so every worker's price book stays current
+    import price_book
+    
     # Import and register routes
     import routes
     import routes_addon  # Import additional routes for QR code tracking
@@ -0,0 +1,364 @@
+"""
+Batch printing of order forms and pull sheets
+
+Renders the job tickets for every order matching a filter (status, due date
+range, customer) into one merged PDF, in due date order with each order's
+order form followed by its pull sheet. Orders are laid out in parallel by a
+small pool of worker processes, and documents already in the PDF cache are
+reused.
+
+    python batch_print.py --status new --due-to 2025-06-02 -o morning.pdf
+
+Batches started from the web app run as background jobs, one at a time per app
+process. A job keeps its status and finished PDF in PDF_BATCH_DIR, so whichever
+process serves the status and download requests can answer them.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import logging
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pypdf import PdfWriter
+from app import app, db
+from models import Order, OrderActivity
+from pdf_cache import PDFCache, order_pdf_key
+from pdf_generator import generate_order_form, generate_pull_sheet
+
+# Documents that can be printed for each order, in print order
+DOCUMENTS = {
+    'order-form': ('order form', generate_order_form),
+    'pull-sheet': ('pull sheet', generate_pull_sheet),
+}
+
+# Largest batch rendered in one go
+BATCH_MAX_ORDERS = 1000
+
+# Below this many orders the pool costs more to start than it saves
+POOL_MIN_ORDERS = 4
+
+# Worker processes used when none are asked for, however many CPUs there are
+DEFAULT_MAX_WORKERS = 4
+
+# Seconds a finished batch job is kept on disk
+BATCH_JOB_RETENTION = 60 * 60
+
+# Seconds after which an unfinished job whose status has not changed is taken
+# to have been abandoned, by an app process that stopped mid-job
+BATCH_JOB_ABANDONED = 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+# State of a pool worker process, set up by _init_worker()
+_pool_worker = {}
+
+# Pool workers are forked from a separate server process that has imported the
+# app, rather than from the web process, whose other threads may hold locks
+# (logging, the connection pool) that a forked child would inherit held
+_pool_context = multiprocessing.get_context('forkserver')
+_pool_context.set_forkserver_preload(['app'])
+
+# Runs this process's batch jobs one after another
+_job_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch-print')
+
+
+def batch_orders_query(status=None, customer_id=None, due_from=None, due_to=None):
+    """
+    Orders to print, soonest due first
+
+    Args:
+        status: Order status, or None for all
+        customer_id: Customer id, or None for all
+        due_from: First due date (date), inclusive
+        due_to: Last due date (date), inclusive
+    """
+    query = Order.query
+    if status:
+        query = query.filter(Order.status == status)
+    if customer_id:
+        query = query.filter(Order.customer_id == customer_id)
+    if due_from:
+        query = query.filter(Order.due_date >= datetime.combine(due_from, datetime.min.time()))
+    if due_to:
+        query = query.filter(Order.due_date < datetime.combine(due_to, datetime.min.time()) + timedelta(days=1))
+    return query.order_by(Order.due_date.is_(None), Order.due_date, Order.id)
+
+
+def _init_worker():
+    """Give a pool worker its own app context and database connections"""
+    context = app.app_context()
+    context.push()
+    # Connections inherited from the fork server must not be shared
+    db.engine.dispose(close=False)
+    _pool_worker['context'] = context
+    _pool_worker['cache'] = _pdf_cache()
+
+
+def _pdf_cache():
+    return PDFCache(app.config['PDF_CACHE_DIR'], app.config['PDF_CACHE_MAX_BYTES'])
+
+
+def _render_order(order_id, documents, cache):
+    """
+    Render the documents of one order
+
+    Args:
+        order_id: Id of the order
+        documents: Keys of DOCUMENTS to render
+        cache: PDFCache to reuse and store the rendered documents in
+
+    Returns:
+        Tuple of (order number, list of (document, PDF bytes))
+    """
+    order = db.session.get(Order, order_id)
+    rendered = []
+    for document in documents:
+        generate = DOCUMENTS[document][1]
+        pdf = cache.get_or_render(order_pdf_key(order, document), lambda: generate(order))
+        if isinstance(pdf, str):
+            with open(pdf, 'rb') as f:
+                rendered.append((document, f.read()))
+        else:
+            with pdf:
+                rendered.append((document, pdf.read()))
+    return order.order_number, rendered
+
+
+def _render_in_worker(order_id, documents):
+    """Render one order in a pool worker, without keeping it in the session"""
+    try:
+        return _render_order(order_id, documents, _pool_worker['cache'])
+    finally:
+        db.session.remove()
+
+
+def render_orders(order_ids, documents=tuple(DOCUMENTS), workers=None):
+    """
+    Render the documents of many orders, in parallel for larger batches
+
+    Must be called inside an app context.
+
+    Args:
+        order_ids: Ids of the orders, in print order
+        documents: Keys of DOCUMENTS to render for each order
+        workers: Number of worker processes; defaults to the CPU count, up to
+            DEFAULT_MAX_WORKERS
+
+    Returns:
+        Generator of (order number, list of (document, PDF bytes)) in order_ids order
+    """
+    order_ids = list(order_ids)
+    workers = workers or min(os.cpu_count() or 1, DEFAULT_MAX_WORKERS)
+    if workers == 1 or len(order_ids) < POOL_MIN_ORDERS:
+        cache = _pdf_cache()
+        for order_id in order_ids:
+            yield _render_order(order_id, documents, cache)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(order_ids)), mp_context=_pool_context,
+                             initializer=_init_worker) as executor:
+        yield from executor.map(_render_in_worker, order_ids, [documents] * len(order_ids))
+
+
+def print_batch(order_ids, out, documents=tuple(DOCUMENTS), workers=None, progress=None):
+    """
+    Render many orders into one merged PDF with a bookmark per document
+
+    Args:
+        order_ids: Ids of the orders, in print order
+        out: Binary file object the merged PDF is written to
+        documents: Keys of DOCUMENTS to render for each order
+        workers: Number of worker processes; defaults to the CPU count, up to
+            DEFAULT_MAX_WORKERS
+        progress: Optional callable(done, total, order_number) called as each order is added
+
+    Returns:
+        Number of orders printed
+    """
+    order_ids = list(order_ids)
+    writer = PdfWriter()
+    done = 0
+    for order_number, rendered in render_orders(order_ids, documents, workers):
+        for document, pdf in rendered:
+            writer.append(io.BytesIO(pdf), outline_item=f"{order_number} {DOCUMENTS[document][0]}")
+        done += 1
+        if progress:
+            progress(done, len(order_ids), order_number)
+    writer.write(out)
+    writer.close()
+    return done
+
+
+def _job_path(job_id, suffix):
+    return os.path.join(app.config['PDF_BATCH_DIR'], f"{job_id}{suffix}")
+
+
+def _write_job_status(job_id, status):
+    """Replace a job's status file, so readers never see it half written"""
+    path = _job_path(job_id, '.json')
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(temp_path, path)
+
+
+def _purge_batch_jobs():
+    """
+    Delete the files of jobs finished more than BATCH_JOB_RETENTION seconds
+    ago, and of unfinished jobs abandoned for BATCH_JOB_ABANDONED seconds
+
+    Queued and running jobs are judged by their status file, which is
+    rewritten as they progress; their PDF is only written once at the end.
+    """
+    now = time.time()
+    for entry in os.scandir(app.config['PDF_BATCH_DIR']):
+        job_id, suffix = os.path.splitext(entry.name)
+        if suffix != '.json':
+            continue
+        try:
+            age = now - entry.stat().st_mtime
+        except OSError:
+            continue
+        status = read_batch_job(job_id)
+        finished = status is None or status['state'] in ('done', 'failed')
+        if age < (BATCH_JOB_RETENTION if finished else BATCH_JOB_ABANDONED):
+            continue
+        for suffix in ('.pdf', '.pdf.part', '.json'):
+            try:
+                os.unlink(_job_path(job_id, suffix))
+            except OSError:
+                # Not written yet, or another process purged it first
+                pass
+
+
+def read_batch_job(job_id):
+    """
+    Status of a batch job
+
+    Returns:
+        Dict with state ('queued', 'running', 'done' or 'failed'), done, total,
+        user_id, download_name and error, or None if there is no such job
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    try:
+        with open(_job_path(job_id, '.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def batch_job_pdf(job_id):
+    """Path of a finished batch job's merged PDF"""
+    return _job_path(job_id, '.pdf')
+
+
+def start_batch_job(order_ids, documents, user_id):
+    """
+    Print a batch in the background
+
+    Args:
+        order_ids: Ids of the orders, in print order
+        documents: Keys of DOCUMENTS to render for each order
+        user_id: User the job belongs to; the orders' activity is logged as theirs
+
+    Returns:
+        Id of the job, for read_batch_job() and batch_job_pdf()
+    """
+    os.makedirs(app.config['PDF_BATCH_DIR'], exist_ok=True)
+    _purge_batch_jobs()
+
+    job_id = uuid.uuid4().hex
+    status = {
+        'state': 'queued',
+        'done': 0,
+        'total': len(order_ids),
+        'user_id': user_id,
+        'download_name': f"job_tickets_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
+        'error': None,
+    }
+    _write_job_status(job_id, status)
+    _job_runner.submit(_run_batch_job, job_id, status, list(order_ids), list(documents))
+    return job_id
+
+
+def _run_batch_job(job_id, status, order_ids, documents):
+    """Print a batch job's PDF and record its progress, in the job runner thread"""
+    part_path = _job_path(job_id, '.pdf.part')
+    with app.app_context():
+        try:
+            status['state'] = 'running'
+            _write_job_status(job_id, status)
+
+            def report(done, total, order_number):
+                status['done'] = done
+                _write_job_status(job_id, status)
+
+            with open(part_path, 'wb') as out:
+                print_batch(order_ids, out, documents, app.config['PDF_BATCH_WORKERS'], report)
+            os.replace(part_path, batch_job_pdf(job_id))
+
+            description = f"{' and '.join(DOCUMENTS[d][0] for d in documents).capitalize()} PDF generated in batch"
+            db.session.add_all([
+                OrderActivity(order_id=order_id, user_id=status['user_id'], activity_type='pdf_generated',
+                              description=description)
+                for order_id in order_ids
+            ])
+            db.session.commit()
+
+            status['state'] = 'done'
+        except Exception as e:
+            logger.exception(f"Batch print job {job_id} failed")
+            db.session.rollback()
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+            status['state'] = 'failed'
+            status['error'] = str(e)
+        _write_job_status(job_id, status)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Print order forms and pull sheets for many orders as one PDF')
+    parser.add_argument('--status', help='Only orders with this status, e.g. new or in-progress')
+    parser.add_argument('--customer-id', type=int, help='Only orders for this customer')
+    parser.add_argument('--due-from', type=_parse_date, help='First due date (YYYY-MM-DD), inclusive')
+    parser.add_argument('--due-to', type=_parse_date, help='Last due date (YYYY-MM-DD), inclusive')
+    parser.add_argument('--documents', nargs='+', choices=list(DOCUMENTS), default=list(DOCUMENTS), help='Documents to print for each order')
+    parser.add_argument('--workers', '-w', type=int, help=f'Worker processes (default: CPU count, up to {DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--output', '-o', help='Output PDF path (default: standard output)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        order_ids = [row.id for row in batch_orders_query(args.status, args.customer_id, args.due_from, args.due_to)
+                     .with_entities(Order.id)]
+        if not order_ids:
+            print("No orders match the filter", file=sys.stderr)
+            sys.exit(1)
+
+        def report(done, total, order_number):
+            print(f"[{done}/{total}] {order_number}", file=sys.stderr)
+
+        if args.output:
+            # Write next to the destination so a failed run leaves no partial PDF
+            directory = os.path.dirname(os.path.abspath(args.output))
+            with tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False) as out:
+                try:
+                    count = print_batch(order_ids, out, args.documents, args.workers, report)
+                except BaseException:
+                    os.unlink(out.name)
+                    raise
+            os.replace(out.name, args.output)
+            print(f"{count} orders printed to {args.output}", file=sys.stderr)
+        else:
+            print_batch(order_ids, sys.stdout.buffer, args.documents, args.workers, report)
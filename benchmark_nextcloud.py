@@ -0,0 +1,144 @@
+"""
+Benchmark NextcloudClient against the local WebDAV stand-in
+
+Measures upload and download throughput (single files, bulk fan-out and
+chunked uploads), folder walks, and how retries cope with injected failures,
+without a live Nextcloud server. Use --latency to model the round-trip time
+to the real server.
+
+    python benchmark_nextcloud.py --latency 0.02 --files 200 --large-size 64
+"""
+import os
+import time
+import logging
+import argparse
+from io import BytesIO
+from webdav_standin import WebDAVStandIn
+
+MB = 1024 * 1024
+
+
+def timed(func, *args, **kwargs):
+    """Run func and return (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report(name, elapsed, count=None, size=None, extra=''):
+    """Print one benchmark result line"""
+    parts = [f"{name:<32}", f"{elapsed:8.3f}s"]
+    if count:
+        parts.append(f"{count / elapsed:9.1f} files/s")
+    if size:
+        parts.append(f"{size / MB / elapsed:9.1f} MB/s")
+    if extra:
+        parts.append(extra)
+    print("  ".join(parts))
+
+
+def bench_small_files(server, args):
+    """Many small files, uploaded and downloaded one by one and in bulk"""
+    client = server.client(pool_size=args.workers)
+    payloads = [os.urandom(args.file_size) for _ in range(args.files)]
+    total = args.files * args.file_size
+
+    _, elapsed = timed(lambda: [client.upload_file(BytesIO(data), f"serial/{i:05d}.pdf") for i, data in enumerate(payloads)])
+    report("upload serial", elapsed, args.files, total)
+
+    files = [(BytesIO(data), f"bulk/{i:05d}.pdf") for i, data in enumerate(payloads)]
+    results, elapsed = timed(client.upload_files, files)
+    report("upload bulk", elapsed, args.files, total, f"{sum(results.values())}/{args.files} ok")
+
+    paths = [f"bulk/{i:05d}.pdf" for i in range(args.files)]
+
+    def download(path):
+        response = client.open_download(path)
+        try:
+            return sum(len(chunk) for chunk in response.iter_content(256 * 1024))
+        finally:
+            response.close()
+
+    _, elapsed = timed(lambda: [download(path) for path in paths])
+    report("download serial (streamed)", elapsed, args.files, total)
+
+    _, elapsed = timed(client._run_bulk, download, paths)
+    report("download bulk (streamed)", elapsed, args.files, total)
+
+    entries, elapsed = timed(lambda: list(client.walk_files()))
+    report("walk tree", elapsed, len(entries))
+
+    # As on Nextcloud with infinite depth disabled
+    server.allow_depth_infinity = False
+    entries, elapsed = timed(lambda: list(client.walk_files()))
+    report("walk tree (Depth: 1 only)", elapsed, len(entries))
+    server.allow_depth_infinity = True
+
+    results, elapsed = timed(client.delete_files, paths)
+    report("delete bulk", elapsed, args.files, extra=f"{sum(results.values())}/{args.files} ok")
+    client.close()
+
+
+def bench_large_file(server, args):
+    """One large file, uploaded in parallel chunks and streamed back"""
+    client = server.client(pool_size=args.workers, chunk_size=args.chunk_size * MB, chunk_workers=args.workers)
+    data = os.urandom(args.large_size * MB)
+
+    server.reset_stats()
+    ok, elapsed = timed(client.upload_file, BytesIO(data), "large/large.tif")
+    report("upload large (chunked)", elapsed, size=len(data), extra=f"ok={ok} requests={dict(server.stats)}")
+
+    response = client.open_download("large/large.tif")
+    received, elapsed = timed(lambda: sum(len(chunk) for chunk in response.iter_content(MB)))
+    response.close()
+    report("download large (streamed)", elapsed, size=received)
+
+    temp_path, elapsed = timed(client.download_file, "large/large.tif")
+    report("download large (temp file)", elapsed, size=len(data))
+    if temp_path:
+        os.unlink(temp_path)
+    client.close()
+
+
+def bench_retries(args):
+    """Uploads against a server failing a share of requests"""
+    with WebDAVStandIn(latency=args.latency, failure_rate=args.failure_rate, seed=1) as server:
+        client = server.client(pool_size=args.workers)
+        client.retry_delay = args.retry_delay
+        files = [(BytesIO(os.urandom(args.file_size)), f"flaky/{i:05d}.pdf") for i in range(args.files)]
+
+        results, elapsed = timed(client.upload_files, files)
+        succeeded = sum(results.values())
+        report(f"upload bulk, {args.failure_rate:.0%} failures", elapsed, args.files, args.files * args.file_size,
+               f"{succeeded}/{args.files} ok, {server.stats['failed']} injected failures, "
+               f"{sum(v for k, v in server.stats.items() if k != 'failed')} requests")
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark NextcloudClient against a local WebDAV stand-in')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds added to every request')
+    parser.add_argument('--files', type=int, default=100, help='Number of small files')
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help='Size of each small file in bytes')
+    parser.add_argument('--large-size', type=int, default=32, help='Size of the large file in MB')
+    parser.add_argument('--chunk-size', type=int, default=8, help='Chunk size for the large upload in MB')
+    parser.add_argument('--workers', type=int, default=8, help='Pool size and bulk/chunk concurrency')
+    parser.add_argument('--failure-rate', type=float, default=0.2, help='Share of requests failed in the retry benchmark')
+    parser.add_argument('--retry-delay', type=float, default=0.01, help='Client retry delay in the retry benchmark')
+    args = parser.parse_args()
+
+    # The client logs every request at DEBUG unless its logger is already configured
+    client_logger = logging.getLogger('nextcloud_client')
+    client_logger.addHandler(logging.NullHandler())
+    client_logger.setLevel(logging.CRITICAL)
+
+    print(f"latency={args.latency}s files={args.files}x{args.file_size}B large={args.large_size}MB workers={args.workers}")
+    with WebDAVStandIn(latency=args.latency) as server:
+        bench_small_files(server, args)
+        bench_large_file(server, args)
+    if args.failure_rate:
+        bench_retries(args)
+
+
+if __name__ == "__main__":
+    main()
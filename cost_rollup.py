@@ -0,0 +1,100 @@
+"""
+Order material cost rollup shared by all reports
+
+Material cost for an order is the sum of saved_price.cost_price * quantity over
+every material on every item of the order. Materials without a saved price (or
+with no cost price) contribute nothing. This is the only place that rule lives.
+"""
+from sqlalchemy import func
+from app import db
+from models import Order, OrderItem, ItemMaterial, SavedPrice
+
+# Keep IN (...) lists well under SQLite's bound parameter limit
+ORDER_ID_CHUNK_SIZE = 500
+
+
+def material_line_cost():
+    """SQL expression for the cost of a single item material row"""
+    return func.coalesce(SavedPrice.cost_price, 0) * func.coalesce(ItemMaterial.quantity, 0)
+
+
+def material_cost_subquery(order_ids=None):
+    """
+    Return a grouped subquery of (order_id, material_cost)
+
+    Args:
+        order_ids: Optional iterable of order ids to restrict the rollup to
+
+    Only orders that have at least one costed material appear in the result,
+    so callers should outer join it and treat missing rows as zero.
+    """
+    query = (
+        db.session.query(
+            OrderItem.order_id.label('order_id'),
+            func.sum(material_line_cost()).label('material_cost')
+        )
+        .join(ItemMaterial, ItemMaterial.order_item_id == OrderItem.id)
+        .join(SavedPrice, SavedPrice.id == ItemMaterial.saved_price_id)
+    )
+    if order_ids is not None:
+        query = query.filter(OrderItem.order_id.in_(list(order_ids)))
+    return query.group_by(OrderItem.order_id).subquery()
+
+
+def order_material_costs(order_ids=None):
+    """
+    Compute material cost for a set of orders in bulk
+
+    Args:
+        order_ids: Iterable of order ids, or None for every order
+
+    Returns:
+        dict mapping order id -> material cost (0 for orders without costed materials)
+    """
+    if order_ids is None:
+        costs = material_cost_subquery()
+        rows = db.session.query(costs.c.order_id, costs.c.material_cost).all()
+        order_ids = [order_id for (order_id,) in db.session.query(Order.id).all()]
+        result = dict.fromkeys(order_ids, 0)
+        result.update(rows)
+        return result
+
+    order_ids = list(order_ids)
+    result = dict.fromkeys(order_ids, 0)
+    for start in range(0, len(order_ids), ORDER_ID_CHUNK_SIZE):
+        chunk = order_ids[start:start + ORDER_ID_CHUNK_SIZE]
+        costs = material_cost_subquery(chunk)
+        result.update(db.session.query(costs.c.order_id, costs.c.material_cost).all())
+    return result
+
+
+def material_usage_rows(order_ids):
+    """
+    Fetch every material line for the given orders with its computed cost
+
+    Returns a list of rows with order_id, created_at, id, material_name,
+    category, quantity, unit and cost attributes.
+    """
+    order_ids = list(order_ids)
+    rows = []
+    for start in range(0, len(order_ids), ORDER_ID_CHUNK_SIZE):
+        chunk = order_ids[start:start + ORDER_ID_CHUNK_SIZE]
+        rows.extend(
+            db.session.query(
+                OrderItem.order_id.label('order_id'),
+                Order.created_at.label('created_at'),
+                ItemMaterial.id.label('id'),
+                ItemMaterial.material_name.label('material_name'),
+                ItemMaterial.category.label('category'),
+                ItemMaterial.quantity.label('quantity'),
+                ItemMaterial.unit.label('unit'),
+                material_line_cost().label('cost')
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .join(ItemMaterial, ItemMaterial.order_item_id == OrderItem.id)
+            .outerjoin(SavedPrice, SavedPrice.id == ItemMaterial.saved_price_id)
+            .filter(OrderItem.order_id.in_(chunk))
+            .order_by(Order.id, ItemMaterial.id)
+            .all()
+        )
+    return rows
@@ -0,0 +1,259 @@
+"""
+Daily revenue/cost rollup maintenance
+
+The daily_rollup table holds order count, revenue and material cost per
+(day, customer). It is kept current from session flush hooks: any
+flushed change to an Order (including its payment fields), OrderItem,
+ItemMaterial or a SavedPrice cost recomputes only the (day, customer) buckets
+it touches. rebuild_daily_rollup() recomputes the whole table; the first
+start after an upgrade runs it once, recorded by the daily_rollup_state row.
+
+Each refreshed bucket row is upserted before it is recomputed, which locks it:
+a concurrent refresh of the same (day, customer) waits, then aggregates the
+orders the first one committed, instead of failing on the unique constraint.
+
+Bulk query.update()/query.delete() calls bypass the ORM and therefore this
+hook; run rebuild_daily_rollup.py after any such maintenance.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import DailyRollup, DailyRollupState, Order, OrderItem, ItemMaterial, SavedPrice
+from cost_rollup import order_material_costs
+
+logger = logging.getLogger(__name__)
+
+
+def _aggregate(order_rows):
+    """
+    Aggregate (id, customer_id, created_at, total_price) order rows by (day, customer)
+
+    Returns:
+        dict mapping (date, customer_id) -> [order_count, revenue, material_cost]
+    """
+    order_rows = [row for row in order_rows if row.created_at is not None]
+    costs = order_material_costs(row.id for row in order_rows)
+    buckets = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in order_rows:
+        bucket = buckets[(row.created_at.date(), row.customer_id)]
+        bucket[0] += 1
+        bucket[1] += row.total_price or 0
+        bucket[2] += costs.get(row.id, 0)
+    return buckets
+
+
+# Row of the daily_rollup_state table
+ROLLUP_STATE_ID = 1
+
+# Dialects whose INSERT supports ON CONFLICT ... DO UPDATE
+UPSERT_DIALECTS = {'postgresql': postgresql, 'sqlite': sqlite}
+
+
+def _bucket_rows(buckets):
+    """daily_rollup rows for aggregated buckets"""
+    now = datetime.utcnow()
+    return [{
+        'date': day,
+        'customer_id': customer_id,
+        'order_count': order_count,
+        'revenue': revenue,
+        'material_cost': material_cost,
+        'updated_at': now,
+    } for (day, customer_id), (order_count, revenue, material_cost) in buckets.items()]
+
+
+def _write_buckets(connection, buckets):
+    """Insert aggregated buckets into daily_rollup"""
+    rows = _bucket_rows(buckets)
+    if rows:
+        connection.execute(DailyRollup.__table__.insert(), rows)
+
+
+def _upsert_buckets(connection, buckets, columns):
+    """
+    Insert buckets into daily_rollup, updating the given columns of existing rows
+
+    Returns:
+        False if the database has no upsert, in which case nothing was written
+    """
+    dialect = UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect is None:
+        return False
+    rows = _bucket_rows(buckets)
+    if rows:
+        statement = dialect.insert(DailyRollup.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['date', 'customer_id'],
+            set_={column: statement.excluded[column] for column in columns}
+        )
+        connection.execute(statement, rows)
+    return True
+
+
+def _aggregate_keys(session, keys):
+    """Aggregate the orders of the given (date, customer_id) keys"""
+    days_by_customer = defaultdict(set)
+    for day, customer_id in keys:
+        days_by_customer[customer_id].add(day)
+
+    order_rows = []
+    for customer_id, days in days_by_customer.items():
+        start = datetime.combine(min(days), datetime.min.time())
+        end = datetime.combine(max(days), datetime.min.time()) + timedelta(days=1)
+
+        order_rows.extend(
+            row for row in session.query(
+                Order.id, Order.customer_id, Order.created_at, Order.total_price
+            ).filter(
+                Order.customer_id == customer_id,
+                Order.created_at >= start,
+                Order.created_at < end
+            ).all()
+            if row.created_at.date() in days
+        )
+    return _aggregate(order_rows)
+
+
+def refresh_rollup_keys(session, keys):
+    """
+    Recompute the daily_rollup rows for the given (date, customer_id) keys
+
+    Keys whose day no longer has any orders for the customer are removed.
+    """
+    table = DailyRollup.__table__
+    connection = session.connection()
+    # Sorted so concurrent refreshes lock shared buckets in the same order
+    keys = sorted(keys)
+
+    # Create or lock every bucket row before aggregating
+    if not _upsert_buckets(connection, {key: (0, 0.0, 0.0) for key in keys}, ['updated_at']):
+        for day, customer_id in keys:
+            connection.execute(table.delete().where(table.c.customer_id == customer_id, table.c.date == day))
+        _write_buckets(connection, _aggregate_keys(session, keys))
+        return
+
+    buckets = _aggregate_keys(session, keys)
+    _upsert_buckets(connection, buckets, ['order_count', 'revenue', 'material_cost', 'updated_at'])
+    for day, customer_id in keys:
+        if (day, customer_id) not in buckets:
+            connection.execute(table.delete().where(table.c.customer_id == customer_id, table.c.date == day))
+
+
+def _rollup_keys_for_orders(session, order_ids):
+    """Look up the (date, customer_id) keys of the given orders"""
+    keys = set()
+    if not order_ids:
+        return keys
+    rows = session.query(Order.customer_id, Order.created_at).filter(Order.id.in_(order_ids)).all()
+    for customer_id, created_at in rows:
+        if created_at is not None:
+            keys.add((created_at.date(), customer_id))
+    return keys
+
+
+def _affected_order_ids(session, include_deleted=True):
+    """Collect the ids of orders touched by the objects pending in a flush"""
+    order_ids = set()
+    order_item_ids = set()
+    saved_price_ids = set()
+
+    objects = list(session.new) + list(session.dirty)
+    if include_deleted:
+        objects += list(session.deleted)
+
+    for obj in objects:
+        if isinstance(obj, Order):
+            order_ids.add(obj.id)
+        elif isinstance(obj, OrderItem):
+            order_ids.add(obj.order_id)
+        elif isinstance(obj, ItemMaterial):
+            order_item_ids.add(obj.order_item_id)
+        elif isinstance(obj, SavedPrice):
+            if inspect(obj).attrs.cost_price.history.has_changes():
+                saved_price_ids.add(obj.id)
+
+    order_item_ids.discard(None)
+    saved_price_ids.discard(None)
+    if order_item_ids:
+        order_ids.update(
+            order_id for (order_id,) in session.query(OrderItem.order_id)
+            .filter(OrderItem.id.in_(order_item_ids)).all()
+        )
+    if saved_price_ids:
+        order_ids.update(
+            order_id for (order_id,) in session.query(OrderItem.order_id)
+            .join(ItemMaterial, ItemMaterial.order_item_id == OrderItem.id)
+            .filter(ItemMaterial.saved_price_id.in_(saved_price_ids))
+            .distinct().all()
+        )
+
+    order_ids.discard(None)
+    return order_ids
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_daily_rollup_keys(session, flush_context, instances):
+    """Remember the buckets touched orders belong to before the flush changes them"""
+    # Needed for orders that are deleted or moved to another customer or day
+    session.info['daily_rollup_keys'] = _rollup_keys_for_orders(session, _affected_order_ids(session))
+
+
+@event.listens_for(db.session, 'after_flush')
+def update_daily_rollup(session, flush_context):
+    """Keep daily_rollup in step with order, item, material and cost changes"""
+    keys = session.info.pop('daily_rollup_keys', set())
+    # Deleted rows are gone by now; their buckets were collected in before_flush
+    keys |= _rollup_keys_for_orders(session, _affected_order_ids(session, include_deleted=False))
+    if keys:
+        refresh_rollup_keys(session, keys)
+
+
+def _rebuild(session):
+    """Recompute the whole daily_rollup table without committing"""
+    connection = session.connection()
+    connection.execute(DailyRollup.__table__.delete())
+
+    order_rows = session.query(
+        Order.id, Order.customer_id, Order.created_at, Order.total_price
+    ).all()
+    buckets = _aggregate(order_rows)
+    _write_buckets(connection, buckets)
+
+    logger.info(f"Rebuilt daily rollup: {len(buckets)} rows from {len(order_rows)} orders")
+    return len(buckets)
+
+
+def rebuild_daily_rollup():
+    """
+    Recompute the whole daily_rollup table from orders
+
+    Returns:
+        Number of rollup rows written
+    """
+    row_count = _rebuild(db.session)
+    db.session.commit()
+    return row_count
+
+
+def ensure_daily_rollup_backfilled():
+    """Backfill daily_rollup from the order history once, on the first start after an upgrade"""
+    if db.session.get(DailyRollupState, ROLLUP_STATE_ID) is not None:
+        return
+    try:
+        # Claim the backfill first; another worker process inserting the
+        # marker concurrently waits for this transaction, then fails
+        db.session.connection().execute(
+            DailyRollupState.__table__.insert().values(id=ROLLUP_STATE_ID, backfilled_at=datetime.utcnow())
+        )
+        _rebuild(db.session)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker process backfilled it first
+        db.session.rollback()
+
+
+ensure_daily_rollup_backfilled()
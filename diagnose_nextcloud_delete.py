@@ -59,7 +59,7 @@ def run_delete_test():
     
     # Step 2: List files to confirm upload
     logger.info("Step 2: Listing files to confirm upload")
-    files = nextcloud.list_files()
+    files = [entry.path for entry in nextcloud.list_files()]
     
     if test_file_path not in files:
         logger.warning(f"Test file {test_file_path} not found in file listing, but upload reported success.")
@@ -77,7 +77,7 @@ def run_delete_test():
         
     # Step 4: List files again to confirm deletion
     logger.info("Step 4: Listing files to confirm deletion")
-    files_after = nextcloud.list_files()
+    files_after = [entry.path for entry in nextcloud.list_files()]
     
     if test_file_path in files_after:
         logger.error(f"Test file {test_file_path} still exists after deletion operation!")
@@ -1,116 +1,364 @@
 """
 Export files from Nextcloud to local directory
 This utility downloads all files from Nextcloud to a local directory for backup or migration.
+
+Files are fetched by a pool of worker threads while the folder tree is still
+being listed. A manifest in the output directory records each file's ETag,
+size and SHA-256, so a rerun into the same directory only downloads files that
+changed since the last export. With --stream-zip the files are written straight
+into a ZIP archive instead of a local copy of the tree.
+
+Files that cannot be exported and folders that cannot be listed are reported
+as they happen, and the script exits with status 1 if the export is incomplete
+so a scheduled backup can detect it.
 """
 import os
+import re
+import sys
+import json
+import shutil
+import hashlib
 import argparse
 import datetime
+import tempfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from nextcloud_client import NextcloudClient
 
 # Load environment variables
 load_dotenv()
 
-def export_files(output_dir=None, create_zip=False):
+MANIFEST_NAME = '.export_manifest.json'
+DEFAULT_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_ATTEMPTS = 3
+
+# Save the manifest after this many downloads so an interrupted run can resume
+MANIFEST_SAVE_INTERVAL = 200
+
+# Files up to this size are buffered in memory on their way into a streamed ZIP
+ZIP_SPOOL_SIZE = 16 * 1024 * 1024
+
+# Checksums Nextcloud may report in the OC-Checksum header
+CHECKSUM_ALGORITHMS = {'SHA1': 'sha1', 'MD5': 'md5', 'SHA256': 'sha256'}
+
+# Content-addressed upload blobs are named after their SHA-256
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/([0-9a-f]{64})(\.[^/]*)?$')
+
+
+class ExportError(Exception):
+    """A file that could not be downloaded or failed verification"""
+    pass
+
+
+def load_manifest(output_dir):
+    """Load the manifest of a previous export, or an empty one"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest atomically so an interrupted save never corrupts it"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def is_unchanged(entry, record, local_path):
+    """Whether a file exported earlier still matches the server's copy"""
+    return (
+        record is not None
+        and record.get('etag') == entry.etag
+        and record.get('size') == entry.size
+        and os.path.exists(local_path)
+        and os.path.getsize(local_path) == entry.size
+    )
+
+
+def fetch_file(client, entry, out):
+    """
+    Stream one file from Nextcloud into a file object and verify it
+
+    The size is checked against the listing, the contents against any
+    OC-Checksum header, and blobs against the SHA-256 in their name.
+
+    Returns:
+        SHA-256 hex digest of the contents
+    """
+    response = client.open_download(entry.path)
+    if response is None or response.status_code != 200:
+        raise ExportError("download failed")
+
+    digests = {'sha256': hashlib.sha256()}
+    expected = {}
+    for checksum in response.headers.get('OC-Checksum', '').split():
+        algorithm, _, value = checksum.partition(':')
+        if algorithm.upper() in CHECKSUM_ALGORITHMS and value:
+            name = CHECKSUM_ALGORITHMS[algorithm.upper()]
+            digests.setdefault(name, hashlib.new(name))
+            expected[name] = value.lower()
+    blob = BLOB_NAME.match(entry.path)
+    if blob:
+        expected.setdefault('sha256', blob.group(1))
+
+    size = 0
+    try:
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            out.write(chunk)
+            size += len(chunk)
+            for digest in digests.values():
+                digest.update(chunk)
+    finally:
+        response.close()
+
+    if entry.size is not None and size != entry.size:
+        raise ExportError(f"size mismatch: expected {entry.size}, got {size}")
+    for name, value in expected.items():
+        if digests[name].hexdigest() != value:
+            raise ExportError(f"{name} checksum mismatch")
+    return digests['sha256'].hexdigest()
+
+
+def with_retries(func, *args):
+    """Call func, retrying on download and verification errors"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise ExportError(str(e)) from e
+
+
+def download_to_directory(client, entry, local_path):
+    """Download a file next to its final path and move it into place once verified"""
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    part_path = f"{local_path}.part"
+    try:
+        with open(part_path, 'wb') as out:
+            sha256 = fetch_file(client, entry, out)
+        os.replace(part_path, local_path)
+    finally:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+    return {'etag': entry.etag, 'size': entry.size, 'sha256': sha256}
+
+
+def download_to_spool(client, entry):
+    """Download a file into a spooled buffer for writing into a ZIP"""
+    spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE)
+    try:
+        fetch_file(client, entry, spool)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def run_bounded(executor, func, items, window):
+    """
+    Run func over items on an executor with at most window calls in flight
+
+    Returns:
+        Generator of (item, future) pairs in completion order
+    """
+    pending = {}
+    for item in items:
+        pending[executor.submit(func, item)] = item
+        if len(pending) >= window:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
+
+def local_path_for(output_dir, file_path):
+    """Local path of an exported file, refusing paths that escape the output directory"""
+    local_path = os.path.normpath(os.path.join(output_dir, file_path))
+    if not local_path.startswith(os.path.normpath(output_dir) + os.sep):
+        raise ExportError(f"unsafe path {file_path}")
+    return local_path
+
+
+def new_stats():
+    """Counters of an export; unlisted counts folders that could not be listed"""
+    return {'downloaded': 0, 'skipped': 0, 'failed': 0, 'unlisted': 0, 'bytes': 0}
+
+
+def listing_error_handler(stats):
+    """on_error callback for walk_files that counts and prints unlisted folders"""
+    def on_error(error):
+        stats['unlisted'] += 1
+        print(f"Failed to list folder: {error}")
+    return on_error
+
+
+def export_to_directory(client, output_dir, workers):
+    """Mirror every file into output_dir, skipping files unchanged since the last run"""
+    manifest = load_manifest(output_dir)
+    stats = new_stats()
+
+    def changed_files():
+        for entry in client.walk_files(on_error=listing_error_handler(stats)):
+            try:
+                local_path = local_path_for(output_dir, entry.path)
+            except ExportError as e:
+                stats['failed'] += 1
+                print(f"Failed to export {entry.path}: {e}")
+                continue
+            if is_unchanged(entry, manifest.get(entry.path), local_path):
+                stats['skipped'] += 1
+                continue
+            yield entry
+
+    def download(entry):
+        return with_retries(download_to_directory, client, entry, local_path_for(output_dir, entry.path))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry, future in run_bounded(executor, download, changed_files(), workers * 2):
+            try:
+                manifest[entry.path] = future.result()
+            except ExportError as e:
+                stats['failed'] += 1
+                print(f"Failed to export {entry.path}: {e}")
+                continue
+            stats['downloaded'] += 1
+            stats['bytes'] += entry.size or 0
+            print(f"Downloaded {entry.path}")
+            if stats['downloaded'] % MANIFEST_SAVE_INTERVAL == 0:
+                save_manifest(output_dir, manifest)
+
+    save_manifest(output_dir, manifest)
+    return stats
+
+
+def export_to_zip(client, zip_path, workers):
+    """Write every file straight into a ZIP archive without a local copy of the tree"""
+    stats = new_stats()
+    files = client.walk_files(on_error=listing_error_handler(stats))
+
+    def download(entry):
+        return with_retries(download_to_spool, client, entry)
+
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry, future in run_bounded(executor, download, files, workers * 2):
+            try:
+                spool = future.result()
+            except ExportError as e:
+                stats['failed'] += 1
+                print(f"Failed to export {entry.path}: {e}")
+                continue
+
+            # Only this thread writes to the archive, one entry at a time
+            modified = entry.last_modified or datetime.datetime.now()
+            info = zipfile.ZipInfo(entry.path, date_time=modified.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = entry.size or 0
+            with spool, zipf.open(info, 'w') as dst:
+                shutil.copyfileobj(spool, dst, DOWNLOAD_CHUNK_SIZE)
+            stats['downloaded'] += 1
+            stats['bytes'] += entry.size or 0
+            print(f"Added {entry.path}")
+    return stats
+
+
+def export_files(output_dir=None, create_zip=False, workers=DEFAULT_WORKERS, stream_zip=None):
     """
     Export files from Nextcloud to local directory
-    
+
     Args:
         output_dir: Directory to save files to. If None, a timestamped directory is created.
         create_zip: Whether to create a ZIP archive of the files
-    
+        workers: Number of files downloaded in parallel
+        stream_zip: Path of a ZIP archive to write files into directly, instead of a directory
+
     Returns:
-        Path to the output directory or ZIP file
+        Path to the output directory or ZIP file, or None if the export failed
+        or is incomplete because files or folders could not be exported
     """
     # Get Nextcloud configuration from environment
     nextcloud_url = os.environ.get('NEXTCLOUD_URL')
     nextcloud_username = os.environ.get('NEXTCLOUD_USERNAME')
     nextcloud_password = os.environ.get('NEXTCLOUD_PASSWORD')
     nextcloud_folder = os.environ.get('NEXTCLOUD_FOLDER', 'print_orders')
-    
+
     # Check if Nextcloud is configured
     if not (nextcloud_url and nextcloud_username and nextcloud_password):
         print("Error: Nextcloud is not configured. Set NEXTCLOUD_URL, NEXTCLOUD_USERNAME, and NEXTCLOUD_PASSWORD environment variables.")
         return None
-    
+
     # Create output directory if not provided
-    if not output_dir:
+    if not output_dir and not stream_zip:
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
         output_dir = f"nextcloud_export_{timestamp}"
-    
-    # Create directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Connect to Nextcloud
+
+    # Connect to Nextcloud, with a pooled connection for each worker and the listing
     try:
         client = NextcloudClient(
             nextcloud_url,
             nextcloud_username,
             nextcloud_password,
-            nextcloud_folder
+            nextcloud_folder,
+            pool_size=workers + 1
         )
-        
-        # List files in Nextcloud
-        files = client.list_files()
-        
-        if not files:
-            print("No files found in Nextcloud")
-            return output_dir
-        
-        # Download each file
-        for file_info in files:
-            file_path = file_info.get('path', '')
-            file_name = os.path.basename(file_path)
-            
-            # Skip directories
-            if file_path.endswith('/'):
-                continue
-            
-            print(f"Downloading {file_path}...")
-            
-            # Create local directory structure if needed
-            rel_path = file_path
-            if rel_path.startswith('/'):
-                rel_path = rel_path[1:]
-            
-            local_path = os.path.join(output_dir, rel_path)
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            
-            # Download file
-            temp_path = client.download_file(file_path)
-            
-            # Move temporary file to final location
-            with open(temp_path, 'rb') as src, open(local_path, 'wb') as dst:
-                dst.write(src.read())
-            
-            # Clean up temporary file
-            os.unlink(temp_path)
-        
+
+        if stream_zip:
+            stats = export_to_zip(client, stream_zip, workers)
+        else:
+            # Create directory if it doesn't exist
+            os.makedirs(output_dir, exist_ok=True)
+            stats = export_to_directory(client, output_dir, workers)
+        client.close()
+
+        print(f"{stats['downloaded']} files downloaded ({stats['bytes']} bytes), "
+              f"{stats['skipped']} unchanged, {stats['failed']} failed, "
+              f"{stats['unlisted']} folders could not be listed")
+        complete = not (stats['failed'] or stats['unlisted'])
+        if not complete:
+            print("Error: the export is incomplete")
+
+        if stream_zip:
+            print(f"Files exported to {stream_zip}")
+            return stream_zip if complete else None
+
         # Create ZIP archive if requested
         if create_zip:
             zip_path = f"{output_dir}.zip"
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 for root, _, files in os.walk(output_dir):
                     for file in files:
+                        if file == MANIFEST_NAME:
+                            continue
                         file_path = os.path.join(root, file)
                         arcname = os.path.relpath(file_path, output_dir)
                         zipf.write(file_path, arcname)
-            
+
             print(f"Files exported to {zip_path}")
-            return zip_path
-        
+            return zip_path if complete else None
+
         print(f"Files exported to {output_dir}")
-        return output_dir
-        
+        return output_dir if complete else None
+
     except Exception as e:
         print(f"Error exporting files: {str(e)}")
         return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Export files from Nextcloud')
-    parser.add_argument('--output', '-o', help='Output directory')
+    parser.add_argument('--output', '-o', help='Output directory; rerunning into the same directory only fetches changed files')
     parser.add_argument('--zip', '-z', action='store_true', help='Create ZIP archive')
+    parser.add_argument('--stream-zip', metavar='ZIP_PATH', help='Write files straight into this ZIP archive without a local copy')
+    parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS, help='Files downloaded in parallel')
     args = parser.parse_args()
-    
-    export_files(args.output, args.zip)
\ No newline at end of file
+
+    if not export_files(args.output, args.zip, max(args.workers, 1), args.stream_zip):
+        sys.exit(1)
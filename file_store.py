@@ -0,0 +1,203 @@
+"""
+Content-addressed storage for order files
+
+Each distinct file is stored once in Nextcloud under blobs/, keyed by its
+SHA-256, and tracked by a FileBlob row with a reference count. Uploading
+contents that are already stored (a reordered logo, re-sent artwork) only
+adds a reference, and deleting an OrderFile removes the stored copy once the
+last reference to it is gone.
+
+A stored copy is only deleted from Nextcloud after the transaction deleting its
+FileBlob row commits. Should the commit fail, the row and the files referring
+to it are kept along with their contents; at worst a stored copy outlives its
+row, which wastes space but loses nothing.
+"""
+import hashlib
+import logging
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from collections import defaultdict
+from app import db
+from models import FileBlob
+
+logger = logging.getLogger(__name__)
+
+# Read size used when hashing an upload
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Nextcloud folder, under the app's root folder, holding the stored blobs
+BLOB_FOLDER = 'blobs'
+
+# session.info key of the stored copies to delete once the session commits
+PENDING_DELETES_KEY = 'file_store_pending_deletes'
+
+
+def hash_stream(stream):
+    """
+    Measure and hash a seekable stream, leaving it rewound
+
+    Returns:
+        Tuple of (size in bytes, SHA-256 hex digest)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    while True:
+        block = stream.read(HASH_BLOCK_SIZE)
+        if not block:
+            break
+        digest.update(block)
+        size += len(block)
+    stream.seek(0)
+    return size, digest.hexdigest()
+
+
+def blob_path(content_hash, extension=''):
+    """Nextcloud path of the blob with the given hash"""
+    return f"{BLOB_FOLDER}/{content_hash[:2]}/{content_hash}{extension.lower()}"
+
+
+def _add_references(blob, delta):
+    """
+    Atomically change a blob's reference count
+
+    Returns:
+        The new reference count, or None if the blob row no longer exists
+    """
+    result = db.session.execute(
+        update(FileBlob)
+        .where(FileBlob.id == blob.id)
+        .values(ref_count=FileBlob.ref_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        return None
+    db.session.refresh(blob, ['ref_count'])
+    return blob.ref_count
+
+
+def _store_blob(nextcloud, stream, size, content_hash, extension):
+    """Upload new contents and create their FileBlob row"""
+    file_path = blob_path(content_hash, extension)
+    if not nextcloud.upload_file(stream, file_path):
+        return None
+
+    blob = FileBlob(content_hash=content_hash, file_path=file_path, file_size=size, ref_count=0)
+    try:
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except IntegrityError:
+        # Another request stored the same contents first; both uploads wrote
+        # identical bytes to the same path, so use its row
+        blob = FileBlob.query.filter_by(content_hash=content_hash).first()
+    return blob
+
+
+def acquire_blob(nextcloud, stream, extension=''):
+    """
+    Store a file's contents, or reuse the stored copy, and take a reference
+
+    The caller commits the session, or rolls it back to drop the reference.
+
+    Args:
+        nextcloud: Nextcloud client to upload new contents with
+        stream: Seekable file object with the upload
+        extension: File extension to give newly stored contents
+
+    Returns:
+        FileBlob holding the contents, or None if the upload failed
+    """
+    size, content_hash = hash_stream(stream)
+
+    # Two attempts: the blob found may be deleted by a concurrent release
+    for _ in range(2):
+        blob = FileBlob.query.filter_by(content_hash=content_hash).first()
+        if blob is not None:
+            logger.debug(f"Reusing stored blob {content_hash} for upload")
+        else:
+            blob = _store_blob(nextcloud, stream, size, content_hash, extension)
+            if blob is None:
+                return None
+
+        if _add_references(blob, 1) is not None:
+            return blob
+        db.session.expunge(blob)
+    return None
+
+
+def _drop_blob(nextcloud, blob):
+    """Delete a blob's row now and its stored copy once the session commits"""
+    db.session.delete(blob)
+    db.session.info.setdefault(PENDING_DELETES_KEY, []).append((nextcloud, blob.file_path))
+
+
+@event.listens_for(db.session, 'after_commit')
+def delete_dropped_blobs(session):
+    pending = session.info.pop(PENDING_DELETES_KEY, None)
+    if not pending:
+        return
+    paths_by_client = defaultdict(list)
+    for nextcloud, file_path in pending:
+        paths_by_client[nextcloud].append(file_path)
+    for nextcloud, file_paths in paths_by_client.items():
+        results = nextcloud.delete_files(file_paths)
+        failed = [file_path for file_path in file_paths if not results.get(file_path)]
+        if failed:
+            logger.warning(f"Could not delete stored copies {failed} of released blobs; they are left orphaned")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def keep_dropped_blobs(session):
+    session.info.pop(PENDING_DELETES_KEY, None)
+
+
+def release_blob(nextcloud, blob):
+    """
+    Drop a reference to a blob, deleting the stored copy with the last one
+
+    The caller commits the session, which deletes the stored copy from
+    Nextcloud, or rolls it back to keep the reference.
+    """
+    remaining = _add_references(blob, -1)
+    if remaining is None:
+        # Already released and deleted by a concurrent request
+        return
+    if remaining > 0:
+        logger.debug(f"Blob {blob.content_hash} still has {remaining} references")
+        return
+    _drop_blob(nextcloud, blob)
+
+
+def delete_order_files(nextcloud, order_files):
+    """
+    Delete many order files, removing stored copies that lose their last reference
+
+    Files stored before content addressing are deleted from Nextcloud
+    concurrently, and a file that could not be deleted there is kept. Stored
+    blobs are deleted once the caller commits.
+
+    Returns:
+        Tuple of (deleted OrderFile rows, OrderFile rows kept)
+    """
+    # Remote path -> files stored outside the blob folder that are removed with it
+    remote = defaultdict(list)
+    deleted = []
+    for order_file in order_files:
+        if order_file.blob is None:
+            remote[order_file.file_path].append(order_file)
+        else:
+            release_blob(nextcloud, order_file.blob)
+            deleted.append(order_file)
+
+    kept = []
+    if remote:
+        results = nextcloud.delete_files(remote.keys())
+        for file_path, files in remote.items():
+            if results.get(file_path):
+                deleted.extend(files)
+            else:
+                kept.extend(files)
+
+    for order_file in deleted:
+        db.session.delete(order_file)
+    return deleted, kept
@@ -87,6 +87,13 @@ class Order(db.Model):
     files = db.relationship('OrderFile', backref='order', lazy=True)
     activities = db.relationship('OrderActivity', backref='order', lazy=True)
     
+    __table_args__ = (
+        # Accounts receivable filters open invoices by payment status and ages them by due date
+        db.Index('ix_order_payment_status_due_date', 'payment_status', 'due_date'),
+        # Keyset pagination of the order list walks (created_at, id) newest first
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+    )
+    
     @property
     def balance_due(self):
         """Calculate the remaining balance due"""
@@ -150,6 +157,35 @@ class ItemMaterial(db.Model):
     def __repr__(self):
         return f'<ItemMaterial {self.material_name}>'
 
+class DailyRollup(db.Model):
+    """Pre-aggregated order figures per day and customer, kept current by daily_rollup.py"""
+    __tablename__ = "daily_rollup"
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    order_count = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Float, default=0.0)
+    material_cost = db.Column(db.Float, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('date', 'customer_id', name='uq_daily_rollup_date_customer'),
+        db.Index('ix_daily_rollup_customer_date', 'customer_id', 'date'),
+    )
+    
+    def __repr__(self):
+        return f'<DailyRollup {self.date} customer={self.customer_id}>'
+
+
+class DailyRollupState(db.Model):
+    """Single-row marker recording when daily_rollup was backfilled from the order history"""
+    __tablename__ = "daily_rollup_state"
+    id = db.Column(db.Integer, primary_key=True)
+    backfilled_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DailyRollupState backfilled_at={self.backfilled_at}>'
+
 class OrderFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -158,6 +194,8 @@ class OrderFile(db.Model):
     file_type = db.Column(db.String(50))  # proof, artwork, reference, etc.
     file_path = db.Column(db.String(500))  # Path in Nextcloud
     file_size = db.Column(db.Integer)
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 hex digest of the file contents
+    blob_id = db.Column(db.Integer, db.ForeignKey('file_blob.id'), index=True)  # Shared stored copy, if deduplicated
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -168,9 +206,23 @@ class OrderFile(db.Model):
     approval_comment = db.Column(db.Text, nullable=True)
     proof_sent_at = db.Column(db.DateTime, nullable=True)
     
+    blob = db.relationship('FileBlob', backref='order_files')
+    
     def __repr__(self):
         return f'<OrderFile {self.original_filename}>'
 
+class FileBlob(db.Model):
+    """A stored file in Nextcloud, shared by every OrderFile with the same contents"""
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 hex digest
+    file_path = db.Column(db.String(500), nullable=False)  # Path in Nextcloud
+    file_size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # OrderFile rows pointing here
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FileBlob {self.content_hash[:12]} refs={self.ref_count}>'
+
 class OrderActivity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -383,6 +435,17 @@ class PrintPricing(db.Model):
         return f'<PrintPricing {self.name}: {self.paper_size} {self.color_type}>'
 
 
+class PricingVersion(db.Model):
+    """Single-row change counter for the pricing tables, bumped by price_book.py"""
+    __tablename__ = "pricing_version"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PricingVersion {self.version}>'
+
+
 class QuoteItemMaterial(db.Model):
     """Materials associated with quote items"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1,19 +1,132 @@
 import os
+import posixpath
 import requests
 import tempfile
 import logging
 import time
+import uuid
+import threading
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from urllib.parse import urlparse
+from urllib.parse import urlparse, unquote
+from email.utils import parsedate_to_datetime
+from xml.etree import ElementTree
+from urllib3.exceptions import HTTPError as Urllib3Error
+
+# Read timeouts in seconds for each kind of request
+DEFAULT_TIMEOUTS = {
+    'metadata': 10,  # PROPFIND/MKCOL on a single folder
+    'list': 30,      # PROPFIND listing a folder's contents
+    'upload': 30,
+    'download': 30,
+    'delete': 30,
+    'assemble': 300, # final MOVE of a chunked upload, which joins the chunks server-side
+}
+DEFAULT_CONNECT_TIMEOUT = 5
+
+# Keep-alive connections kept open per host; match the number of worker threads
+DEFAULT_POOL_SIZE = 10
+
+# Files larger than one chunk are uploaded with Nextcloud's chunked upload v2
+# protocol. Chunks other than the last must be at least 5 MiB.
+DEFAULT_CHUNK_SIZE = 10 * 1024 * 1024
+MIN_CHUNK_SIZE = 5 * 1024 * 1024
+DEFAULT_CHUNK_WORKERS = 4
+
+# Bulk downloads are held in memory up to this size each, then spill to an
+# anonymous temporary file
+DOWNLOAD_SPOOL_SIZE = 1024 * 1024
+
+# How long a folder seen on the server is trusted to still exist, and how many are remembered
+DEFAULT_FOLDER_CACHE_TTL = 300
+FOLDER_CACHE_SIZE = 1024
+
+DAV_NS = '{DAV:}'
+
+# Properties requested when listing folders
+PROPFIND_BODY = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<d:propfind xmlns:d="DAV:"><d:prop>'
+    '<d:resourcetype/><d:getcontentlength/><d:getetag/><d:getlastmodified/><d:getcontenttype/>'
+    '</d:prop></d:propfind>'
+)
+
+# One entry of a folder listing. path is relative to the root folder, size is
+# None for folders and last_modified is a timezone-aware datetime.
+FileEntry = namedtuple('FileEntry', ['href', 'path', 'name', 'size', 'etag', 'last_modified', 'content_type', 'is_collection'])
+
+
+def _file_entry(response_elem, prefix):
+    """Build a FileEntry from a parsed <d:response> element"""
+    href = response_elem.findtext(f'{DAV_NS}href')
+    if not href:
+        return None
+    path = unquote(href)
+    if path.startswith(prefix):
+        path = path[len(prefix):]
+    path = path.strip('/')
+
+    # Only properties reported with a 200 status are present
+    props = {}
+    for propstat in response_elem.iterfind(f'{DAV_NS}propstat'):
+        if ' 200 ' in (propstat.findtext(f'{DAV_NS}status') or ''):
+            for prop in propstat.iterfind(f'{DAV_NS}prop/*'):
+                props[prop.tag] = prop
+
+    def text(name):
+        prop = props.get(f'{DAV_NS}{name}')
+        return prop.text if prop is not None and prop.text else None
+
+    resourcetype = props.get(f'{DAV_NS}resourcetype')
+    is_collection = resourcetype is not None and resourcetype.find(f'{DAV_NS}collection') is not None
+    size = text('getcontentlength')
+    last_modified = text('getlastmodified')
+    return FileEntry(
+        href=href,
+        path=path,
+        name=path.rsplit('/', 1)[-1],
+        size=int(size) if size is not None else None,
+        etag=text('getetag'),
+        last_modified=parsedate_to_datetime(last_modified) if last_modified else None,
+        content_type=text('getcontenttype'),
+        is_collection=is_collection,
+    )
+
+
+class ListingError(Exception):
+    """A folder that could not be listed, or whose listing was cut short"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class NextcloudClient:
-    def __init__(self, base_url, username, password, root_folder):
+    def __init__(self, base_url, username, password, root_folder,
+                 pool_size=DEFAULT_POOL_SIZE, timeouts=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 folder_cache_ttl=DEFAULT_FOLDER_CACHE_TTL,
+                 chunk_size=DEFAULT_CHUNK_SIZE, chunk_workers=DEFAULT_CHUNK_WORKERS):
         self.base_url = base_url.rstrip('/') if base_url else ""
         self.username = username
         self.password = password
         self.root_folder = root_folder
         self.auth = HTTPBasicAuth(username, password)
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.connect_timeout = connect_timeout
+        self.chunk_size = max(chunk_size, MIN_CHUNK_SIZE)
+        self.chunk_workers = max(chunk_workers, 1)
+        
+        # One long-lived session so every call reuses warm keep-alive connections
+        self.pool_size = max(pool_size, 1)
+        self.session = self._create_session(self.pool_size)
+        
+        # Folders known to exist ('' is the root folder) -> expiry time
+        self.folder_cache_ttl = folder_cache_ttl
+        self._known_folders = OrderedDict()
+        self._known_folders_lock = threading.Lock()
         
         # Set up enhanced logging
         self.logger = logging.getLogger(__name__)
@@ -37,6 +150,50 @@ class NextcloudClient:
         self.max_retries = 3
         self.retry_delay = 1  # second
         
+    def _create_session(self, pool_size):
+        """Create a requests session with a connection pool of the given size"""
+        session = requests.Session()
+        session.auth = self.auth
+        # Retries are handled per operation, so the adapter must not retry on its own
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def _timeout(self, operation):
+        """(connect, read) timeout for an operation"""
+        return (self.connect_timeout, self.timeouts[operation])
+    
+    def close(self):
+        """Close the pooled connections"""
+        self.session.close()
+        
+    def _folder_known(self, path):
+        """Whether a folder was seen on the server within the cache TTL"""
+        with self._known_folders_lock:
+            expires = self._known_folders.get(path)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._known_folders[path]
+                return False
+            self._known_folders.move_to_end(path)
+            return True
+    
+    def _remember_folder(self, path):
+        with self._known_folders_lock:
+            self._known_folders[path] = time.monotonic() + self.folder_cache_ttl
+            self._known_folders.move_to_end(path)
+            while len(self._known_folders) > FOLDER_CACHE_SIZE:
+                self._known_folders.popitem(last=False)
+    
+    def _forget_folder(self, path):
+        """Drop a folder and everything below it from the known-folder cache"""
+        prefix = f"{path}/"
+        with self._known_folders_lock:
+            for known in [k for k in self._known_folders if k == path or k.startswith(prefix) or not path]:
+                del self._known_folders[known]
+        
     def _try_alternative_username_format(self):
         """
         Some Nextcloud instances don't recognize email-format usernames.
@@ -51,38 +208,26 @@ class NextcloudClient:
         """
         Ensure that the given folder path exists in Nextcloud
         Handles nested folder creation if necessary
+        
+        Folders confirmed by PROPFIND or created by MKCOL are cached for
+        folder_cache_ttl seconds, so repeat uploads into the same folder
+        skip these round trips entirely.
         """
-        if not folder_path:
+        # Files directly in the root folder still need the root folder itself
+        folder_path = (folder_path or '').strip('/')
+        if self._folder_known(folder_path):
             return True
             
         # First ensure the root folder exists
         root_url = f"{self.base_url}/remote.php/dav/files/{self.username}/{self.root_folder}"
         
-        try:
-            response = requests.request(
-                "PROPFIND",
-                root_url,
-                auth=self.auth,
-                headers={"Depth": "0"},
-                timeout=10
-            )
-            
-            # If root folder doesn't exist, create it
-            if response.status_code == 404:
-                self.logger.debug(f"Creating root folder: {self.root_folder}")
-                response = requests.request(
-                    "MKCOL",
-                    root_url,
-                    auth=self.auth,
-                    timeout=10
-                )
-                
-                if response.status_code not in [201, 204]:
-                    self.logger.error(f"Failed to create root folder: {response.status_code} - {response.text}")
+        if not self._folder_known(''):
+            try:
+                if not self._check_or_create_folder(root_url, ''):
                     return False
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"Network error checking root folder: {str(e)}")
-            return False
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f"Network error checking root folder: {str(e)}")
+                return False
         
         # Split the folder path into components to create each level if needed
         path_components = folder_path.split('/')
@@ -96,39 +241,56 @@ class NextcloudClient:
                 current_path = f"{current_path}/{component}"
             else:
                 current_path = component
+            
+            if self._folder_known(current_path):
+                continue
                 
             folder_url = f"{self.base_url}/remote.php/dav/files/{self.username}/{self.root_folder}/{current_path}"
             
             try:
-                # Check if this folder level exists
-                response = requests.request(
-                    "PROPFIND",
-                    folder_url,
-                    auth=self.auth,
-                    headers={"Depth": "0"},
-                    timeout=10
-                )
-                
-                # If folder doesn't exist, create it
-                if response.status_code == 404:
-                    self.logger.debug(f"Creating folder: {current_path}")
-                    response = requests.request(
-                        "MKCOL",
-                        folder_url,
-                        auth=self.auth,
-                        timeout=10
-                    )
-                    
-                    if response.status_code not in [201, 204]:
-                        self.logger.error(f"Failed to create folder {current_path}: "
-                                         f"{response.status_code} - {response.text}")
-                        return False
-                        
+                if not self._check_or_create_folder(folder_url, current_path):
+                    return False
             except requests.exceptions.RequestException as e:
                 self.logger.error(f"Network error creating folder {current_path}: {str(e)}")
                 return False
                 
         return True
+    
+    def _check_or_create_folder(self, folder_url, folder_path):
+        """
+        PROPFIND a single folder and MKCOL it if missing
+        
+        Returns:
+            False if the folder could not be created, True otherwise
+        """
+        # Check if this folder level exists
+        response = self.session.request(
+            "PROPFIND",
+            folder_url,
+            headers={"Depth": "0"},
+            timeout=self._timeout('metadata')
+        )
+        
+        if response.status_code == 207:
+            self._remember_folder(folder_path)
+        
+        # If folder doesn't exist, create it
+        elif response.status_code == 404:
+            self.logger.debug(f"Creating folder: {folder_path or self.root_folder}")
+            response = self.session.request(
+                "MKCOL",
+                folder_url,
+                timeout=self._timeout('metadata')
+            )
+            
+            # 405 means the folder exists, created meanwhile by a concurrent upload
+            if response.status_code not in [201, 204, 405]:
+                self.logger.error(f"Failed to create folder {folder_path or self.root_folder}: "
+                                 f"{response.status_code} - {response.text}")
+                return False
+            self._remember_folder(folder_path)
+        
+        return True
 
     def upload_file(self, file_obj, file_path):
         """Upload a file to Nextcloud with retry capability"""
@@ -141,7 +303,7 @@ class NextcloudClient:
         folder_path = os.path.dirname(file_path)
         
         # Ensure folder exists
-        if folder_path and not self._ensure_folder_exists(folder_path):
+        if not self._ensure_folder_exists(folder_path):
             self.logger.error(f"Failed to create or access folder: {folder_path}")
             return False
         
@@ -149,7 +311,15 @@ class NextcloudClient:
         url = f"{self.base_url}/remote.php/dav/files/{self.username}/{self.root_folder}/{file_path}"
         self.logger.debug(f"Uploading file to: {url}")
         
+        # Large files go up in chunks so a failure only resends one chunk
+        file_obj.seek(0, os.SEEK_END)
+        total_size = file_obj.tell()
+        file_obj.seek(0)
+        if total_size > self.chunk_size:
+            return self._upload_chunked(file_obj, file_path, url, total_size)
+        
         # Implement retry logic
+        folder_rechecked = False
         for attempt in range(1, self.max_retries + 1):
             try:
                 # Reset file pointer to beginning for each attempt
@@ -164,11 +334,10 @@ class NextcloudClient:
                                  f"Uploading file {file_path} ({file_size} bytes)")
                 
                 # Upload with timeout to prevent hanging
-                response = requests.put(
+                response = self.session.put(
                     url,
                     data=file_obj,
-                    auth=self.auth,
-                    timeout=30,  # 30 second timeout
+                    timeout=self._timeout('upload'),
                     headers={
                         'Content-Type': 'application/octet-stream'
                     }
@@ -182,6 +351,15 @@ class NextcloudClient:
                                f"Status {response.status_code} - {response.text}"
                     self.logger.error(error_msg)
                     
+                    # A missing parent folder means the known-folder cache is stale;
+                    # recreate the folder once and try again
+                    if response.status_code in [404, 409]:
+                        self._forget_folder(folder_path.strip('/'))
+                        if not folder_rechecked and attempt < self.max_retries:
+                            folder_rechecked = True
+                            if self._ensure_folder_exists(folder_path):
+                                continue
+                    
                     # Check for specific error codes to determine if retry is appropriate
                     if response.status_code in [400, 401, 403, 404, 409, 413]:
                         # Client errors that won't be resolved by retrying
@@ -206,33 +384,176 @@ class NextcloudClient:
         self.logger.error(f"Failed to upload file after {self.max_retries} attempts")
         return False
 
+    def _upload_chunked(self, file_obj, file_path, destination, total_size):
+        """
+        Upload a large file with Nextcloud's chunked upload (v2) protocol
+        
+        Creates an upload folder, PUTs fixed-size numbered chunks in parallel
+        (each retried on its own), then MOVEs the virtual .file onto the
+        destination so the server assembles it. The upload folder is deleted
+        if any step fails.
+        """
+        upload_url = f"{self.base_url}/remote.php/dav/uploads/{self.username}/printshop-{uuid.uuid4().hex}"
+        headers = {'Destination': destination, 'OC-Total-Length': str(total_size)}
+        chunk_count = (total_size + self.chunk_size - 1) // self.chunk_size
+        self.logger.debug(f"Uploading {file_path} ({total_size} bytes) in {chunk_count} chunks")
+        
+        try:
+            response = self.session.request("MKCOL", upload_url, headers=headers,
+                                            timeout=self._timeout('metadata'))
+            if response.status_code not in [201, 204]:
+                self.logger.error(f"Failed to start chunked upload: {response.status_code} - {response.text}")
+                return False
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Network error starting chunked upload: {str(e)}")
+            return False
+        
+        # Chunks are read one at a time, so memory stays at one chunk per worker
+        read_lock = threading.Lock()
+        
+        def upload_chunk(index):
+            with read_lock:
+                file_obj.seek(index * self.chunk_size)
+                data = file_obj.read(self.chunk_size)
+            # Chunk names must sort in upload order
+            chunk_url = f"{upload_url}/{index + 1:05d}"
+            
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    response = self.session.put(chunk_url, data=data, headers=headers,
+                                                timeout=self._timeout('upload'))
+                    if response.status_code in [201, 204]:
+                        return True
+                    self.logger.error(f"Failed to upload chunk {index + 1}/{chunk_count} "
+                                      f"(Attempt {attempt}/{self.max_retries}): "
+                                      f"Status {response.status_code} - {response.text}")
+                    if response.status_code in [400, 401, 403, 404, 409, 413, 507]:
+                        return False
+                except requests.exceptions.RequestException as e:
+                    self.logger.error(f"Network error uploading chunk {index + 1}/{chunk_count} "
+                                      f"(Attempt {attempt}/{self.max_retries}): {str(e)}")
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_delay * (2 ** (attempt - 1)))  # Exponential backoff
+            return False
+        
+        with ThreadPoolExecutor(max_workers=min(self.chunk_workers, chunk_count)) as executor:
+            chunks_ok = all(executor.map(upload_chunk, range(chunk_count)))
+        
+        if chunks_ok:
+            try:
+                response = self.session.request("MOVE", f"{upload_url}/.file", headers=headers,
+                                                timeout=self._timeout('assemble'))
+                if response.status_code in [201, 204]:
+                    self.logger.debug(f"File uploaded successfully: {file_path}")
+                    return True
+                self.logger.error(f"Failed to assemble chunked upload: {response.status_code} - {response.text}")
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f"Network error assembling chunked upload: {str(e)}")
+        
+        # Clean up the partial upload on the server
+        try:
+            self.session.delete(upload_url, timeout=self._timeout('delete'))
+        except requests.exceptions.RequestException:
+            pass
+        return False
+
     def download_file(self, file_path):
-        """Download a file from Nextcloud and return a temporary file path"""
+        """Download a file from Nextcloud and return a temporary file path, or None on failure"""
         url = f"{self.base_url}/remote.php/dav/files/{self.username}/{self.root_folder}/{file_path}"
         
         self.logger.debug(f"Downloading file from: {url}")
         
-        response = requests.get(
-            url,
-            auth=self.auth,
-            stream=True
-        )
-        
-        if response.status_code == 200:
-            # Create a temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False)
-            
-            # Write the file content to the temporary file
-            for chunk in response.iter_content(chunk_size=8192):
-                temp_file.write(chunk)
+        temp_file = None
+        try:
+            # Closing the streamed response hands the connection back to the pool
+            with self.session.get(
+                url,
+                stream=True,
+                timeout=self._timeout('download')
+            ) as response:
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to download file: {response.status_code} - {response.text}")
+                    return None
                 
-            temp_file.close()
-            
-            self.logger.debug(f"File downloaded successfully: {file_path}")
-            return temp_file.name
-        else:
-            self.logger.error(f"Failed to download file: {response.status_code} - {response.text}")
+                # Write the file content to a temporary file the caller deletes
+                temp_file = tempfile.NamedTemporaryFile(delete=False)
+                with temp_file:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        temp_file.write(chunk)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Network error during download: {str(e)}")
+            if temp_file is not None:
+                os.unlink(temp_file.name)
+            return None
+        
+        self.logger.debug(f"File downloaded successfully: {file_path}")
+        return temp_file.name
+
+    def _download_to_spool(self, file_path):
+        """Download a file into an anonymous spooled temporary file, or None on failure"""
+        response = self.open_download(file_path)
+        if response is None:
+            return None
+        
+        spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+        try:
+            with response:
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to download file: {response.status_code}")
+                    spool.close()
+                    return None
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    spool.write(chunk)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Network error during download of {file_path}: {str(e)}")
+            spool.close()
             return None
+        
+        spool.seek(0)
+        return spool
+
+    def open_download(self, file_path, range_header=None, if_range=None):
+        """
+        Open a streaming download of a file without buffering it locally
+
+        Args:
+            file_path: Path of the file below the root folder
+            range_header: Optional HTTP Range header to forward (e.g. "bytes=0-1023")
+            if_range: Optional If-Range header to forward with the range
+
+        Returns:
+            The open requests response (200, 206 or 416) whose body has not been
+            read yet, or None if the file could not be fetched. The caller must
+            close the response to return its connection to the pool.
+        """
+        url = f"{self.base_url}/remote.php/dav/files/{self.username}/{self.root_folder}/{file_path}"
+
+        # Ask for the raw bytes so lengths and ranges match what is streamed
+        headers = {'Accept-Encoding': 'identity'}
+        if range_header:
+            headers['Range'] = range_header
+            if if_range:
+                headers['If-Range'] = if_range
+
+        self.logger.debug(f"Streaming file from: {url}")
+
+        try:
+            response = self.session.get(
+                url,
+                headers=headers,
+                stream=True,
+                timeout=self._timeout('download')
+            )
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Network error during download: {str(e)}")
+            return None
+
+        if response.status_code in [200, 206, 416]:
+            return response
+
+        self.logger.error(f"Failed to download file: {response.status_code} - {response.text}")
+        response.close()
+        return None
 
     def delete_file(self, file_path):
         """Delete a file from Nextcloud"""
@@ -242,10 +563,9 @@ class NextcloudClient:
         self.logger.debug(f"Using auth: username={self.username}, password=******")
         
         try:
-            response = requests.delete(
+            response = self.session.delete(
                 url,
-                auth=self.auth,
-                timeout=30  # Add timeout to prevent hanging
+                timeout=self._timeout('delete')
             )
             
             if response.status_code in [204, 404]:  # 204 = Success, 404 = Already gone
@@ -270,34 +590,223 @@ class NextcloudClient:
             self.logger.error(f"Network error during file deletion: {str(e)}")
             return False
 
-    def list_files(self, folder_path=""):
-        """List files in a folder"""
+    def _propfind(self, folder_path, depth):
+        """Send a PROPFIND for a folder's entries and return the unread, streamed response"""
         url = f"{self.base_url}/remote.php/dav/files/{self.username}/{self.root_folder}/{folder_path}"
-        
-        response = requests.request(
+        return self.session.request(
             "PROPFIND",
             url,
-            auth=self.auth,
-            headers={"Depth": "1"}
+            data=PROPFIND_BODY,
+            headers={"Depth": depth, "Content-Type": "application/xml; charset=utf-8"},
+            stream=True,
+            timeout=self._timeout('list')
         )
-        
-        if response.status_code == 207:  # Multi-status response
-            # This is a simplified parsing of the XML response
-            # For production, use a proper XML parser
-            files = []
-            for line in response.text.split("<d:href>"):
-                if "remote.php/dav/files" in line:
-                    file_path = line.split("</d:href>")[0]
-                    file_name = file_path.split("/")[-1]
-                    if file_name:  # Skip the current directory entry
-                        files.append(file_name)
-            
-            self.logger.debug(f"Files in {folder_path}: {files}")
-            return files
+
+    def _parse_entries(self, response, folder_path):
+        """
+        Parse a multistatus body incrementally, yielding one FileEntry per response
+
+        Each <d:response> is dropped once parsed, so memory use does not grow
+        with the number of entries. The entry for folder_path itself is skipped.
+        """
+        prefix = f"{urlparse(self.base_url).path}/remote.php/dav/files/{self.username}/{self.root_folder}/"
+        response.raw.decode_content = True
+        try:
+            root = None
+            for event, elem in ElementTree.iterparse(response.raw, events=('start', 'end')):
+                if root is None:
+                    root = elem
+                if event != 'end' or elem.tag != f'{DAV_NS}response':
+                    continue
+
+                entry = _file_entry(elem, prefix)
+                root.clear()
+                if entry is None or entry.path == folder_path:
+                    continue
+                if entry.is_collection:
+                    self._remember_folder(entry.path)
+                yield entry
+        finally:
+            response.close()
+
+    def _list_folder(self, folder_path, depth):
+        """
+        Yield the entries of a folder listing as it streams in
+
+        Raises:
+            ListingError: If the folder could not be listed or the listing was cut short
+        """
+        try:
+            response = self._propfind(folder_path, depth)
+        except requests.exceptions.RequestException as e:
+            raise ListingError(f"Network error listing {folder_path}: {str(e)}") from e
+
+        if response.status_code != 207:  # Multi-status response
+            if response.status_code == 404:
+                self._forget_folder(folder_path)
+            message = f"Failed to list files in {folder_path}: {response.status_code} - {response.text}"
+            response.close()
+            raise ListingError(message, response.status_code)
+
+        self._remember_folder(folder_path)
+        try:
+            yield from self._parse_entries(response, folder_path)
+        except (requests.exceptions.RequestException, Urllib3Error, ElementTree.ParseError) as e:
+            raise ListingError(f"Listing of {folder_path} was cut short: {str(e)}") from e
+
+    def iter_files(self, folder_path="", depth="1"):
+        """
+        Yield the entries in a folder as the listing streams in
+
+        Args:
+            folder_path: Folder below the root folder ("" for the root folder)
+            depth: PROPFIND depth, "1" for the folder's own entries or "infinity"
+
+        Returns:
+            Generator of FileEntry, files and folders alike
+        """
+        try:
+            yield from self._list_folder(folder_path.strip('/'), depth)
+        except ListingError as e:
+            self.logger.error(str(e))
+
+    def walk_files(self, folder_path="", on_error=None):
+        """
+        Yield every file below a folder, at any depth
+
+        Uses a single Depth: infinity PROPFIND, and lists one folder at a time
+        wherever the server did not return a folder's contents. Nextcloud
+        with infinite depth disabled answers as if Depth: 1 was asked for,
+        while some proxies refuse the request outright.
+
+        Args:
+            folder_path: Folder below the root folder ("" for the root folder)
+            on_error: Callable taking a ListingError, called for each folder
+                that could not be listed and so is missing from the walk; by
+                default the error is logged
+
+        Returns:
+            Generator of FileEntry for files only
+        """
+        folder_path = folder_path.strip('/')
+        on_error = on_error or (lambda e: self.logger.error(str(e)))
+        folders = []
+        parents = set()
+        try:
+            for entry in self._list_folder(folder_path, "infinity"):
+                parents.add(posixpath.dirname(entry.path))
+                if entry.is_collection:
+                    folders.append(entry.path)
+                else:
+                    yield entry
+        except ListingError as e:
+            if e.status_code not in (400, 403, 501):
+                on_error(e)
+                return
+            self.logger.debug(f"Depth: infinity refused for {folder_path}, listing folder by folder")
+            pending = deque([folder_path])
         else:
-            self.logger.error(f"Failed to list files: {response.status_code} - {response.text}")
+            # Folders listed without their contents; empty folders are listed
+            # again too, which costs one request each
+            pending = deque(path for path in folders if path not in parents)
+            if pending:
+                self.logger.debug(f"Depth: infinity listing of {folder_path} missed {len(pending)} folders, listing them one by one")
+
+        # Walk the rest of the tree breadth-first
+        while pending:
+            folder = pending.popleft()
+            try:
+                for entry in self._list_folder(folder, "1"):
+                    if entry.is_collection:
+                        pending.append(entry.path)
+                    else:
+                        yield entry
+            except ListingError as e:
+                on_error(e)
+
+    def list_files(self, folder_path=""):
+        """List the files and folders in a folder as FileEntry tuples"""
+        files = list(self.iter_files(folder_path))
+        self.logger.debug(f"Files in {folder_path}: {[entry.name for entry in files]}")
+        return files
+
+    def stat_file(self, file_path):
+        """Metadata of a single file or folder as a FileEntry, or None if it does not exist"""
+        file_path = file_path.strip('/')
+        try:
+            response = self._propfind(file_path, "0")
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Network error checking {file_path}: {str(e)}")
+            return None
+
+        if response.status_code != 207:
+            if response.status_code != 404:
+                self.logger.error(f"Failed to check file: {response.status_code} - {response.text}")
+            response.close()
+            return None
+        return next(self._parse_entries(response, None), None)
+
+    # Bulk operations. Each runs its requests concurrently over the pooled
+    # connections, at most `workers` (the pool size by default) at a time.
+
+    def _run_bulk(self, func, items, workers=None):
+        """
+        Call func for every item concurrently and return the results in item order
+
+        A network error raised for one item becomes a None result for that item
+        instead of aborting the others.
+        """
+        items = list(items)
+        if not items:
             return []
 
+        def call(item):
+            try:
+                return func(item)
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f"Network error in bulk operation: {str(e)}")
+                return None
+
+        workers = min(workers or self.pool_size, len(items))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(call, items))
+
+    def upload_files(self, files, workers=None):
+        """
+        Upload many files concurrently
+
+        Args:
+            files: Iterable of (file_obj, file_path) pairs
+
+        Returns:
+            dict of file_path -> whether the upload succeeded
+        """
+        files = list(files)
+        results = self._run_bulk(lambda item: self.upload_file(*item), files, workers)
+        return {file_path: result for (_, file_path), result in zip(files, results)}
+
+    def download_files(self, file_paths, workers=None):
+        """
+        Download many files concurrently
+
+        Returns:
+            dict of file_path -> open file object positioned at the start of the
+            contents, or None if that download failed. The caller closes the
+            file objects; they leave nothing behind on disk.
+        """
+        file_paths = list(file_paths)
+        return dict(zip(file_paths, self._run_bulk(self._download_to_spool, file_paths, workers)))
+
+    def delete_files(self, file_paths, workers=None):
+        """Delete many files concurrently, returning file_path -> whether it is gone"""
+        file_paths = list(file_paths)
+        return dict(zip(file_paths, self._run_bulk(self.delete_file, file_paths, workers)))
+
+    def stat_files(self, file_paths, workers=None):
+        """Check many files concurrently, returning file_path -> FileEntry or None if missing"""
+        file_paths = list(file_paths)
+        return dict(zip(file_paths, self._run_bulk(self.stat_file, file_paths, workers)))
+
     def get_preview_url(self, file_path):
         """Get a preview URL for a file (for images, PDFs, etc.)"""
         return f"{self.base_url}/index.php/apps/files/ajax/preview.php?file=/{self.root_folder}/{file_path}&x=1024&y=1024&a=true&t={self.username}"
@@ -0,0 +1,188 @@
+"""
+Content-keyed cache of generated order and quote PDFs
+
+A PDF is cached under a fingerprint of everything it is rendered from: the
+template version, the order or quote with its customer, items and materials,
+and for pull sheets the pricing version and the print date. Any change to those
+changes the fingerprint, so a stale PDF is never served; old entries simply
+age out.
+
+Entries are files in one directory shared by every worker process. A hit
+records its use in the file's access time, leaving the modification time (and
+so the ETag and Last-Modified that send_file derives from it) unchanged. Each
+new entry evicts the least recently used files once the directory grows past
+its size limit.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import date
+from price_book import current_pricing_version
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of any generated PDF changes, to retire cached copies
+PDF_TEMPLATE_VERSION = 2
+
+
+def _row_values(obj):
+    """Column values of a model instance, in mapper order"""
+    if obj is None:
+        return None
+    return tuple(getattr(obj, attr.key) for attr in obj.__mapper__.column_attrs)
+
+
+def _items_values(items):
+    """Column values of items and their materials, in id order"""
+    return [
+        (_row_values(item), [_row_values(material) for material in sorted(item.materials, key=lambda m: m.id)])
+        for item in sorted(items, key=lambda i: i.id)
+    ]
+
+
+def _fingerprint(kind, *parts):
+    digest = hashlib.sha256(repr((PDF_TEMPLATE_VERSION, kind) + parts).encode())
+    return f"{kind}-{digest.hexdigest()}"
+
+
+def order_pdf_key(order, kind):
+    """
+    Cache key of an order's order form or pull sheet
+
+    Args:
+        order: Order to render
+        kind: 'order-form' or 'pull-sheet'
+    """
+    parts = (_row_values(order), _row_values(order.customer), _items_values(order.items))
+    if kind == 'pull-sheet':
+        # Pull sheets list the source quote's materials, SKUs from the price
+        # book and today's date
+        from models import Quote
+        quote_id = getattr(order, 'quote_id', None)
+        quote = Quote.query.get(quote_id) if quote_id else None
+        parts += (_items_values(quote.items) if quote else None, current_pricing_version(), date.today().isoformat())
+    return _fingerprint(kind, *parts)
+
+
+def quote_pdf_key(quote):
+    """Cache key of a quote's PDF"""
+    return _fingerprint('quote', _row_values(quote), _row_values(quote.customer), _items_values(quote.items))
+
+
+class PDFCache:
+    """
+    Size-bounded LRU cache of rendered PDFs on local disk
+
+    Args:
+        directory: Directory holding the cached files, created if missing
+        max_bytes: Total size the cache may grow to; 0 disables caching
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if max_bytes:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key):
+        """Path of the cached PDF for a key, or None on a miss"""
+        path = self._path(key)
+        try:
+            # Mark as recently used in the access time only
+            stat = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, pdf):
+        """
+        Store a rendered PDF
+
+        Args:
+            key: Cache key
+            pdf: Binary file object positioned at the start of the PDF; it is
+                read to the end and left open
+
+        Returns:
+            Path of the cached PDF, or None if it could not be cached
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                for block in iter(lambda: pdf.read(1024 * 1024), b''):
+                    f.write(block)
+            size = os.path.getsize(temp_path)
+            if size > self.max_bytes:
+                os.unlink(temp_path)
+                return None
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache PDF {key}: {e}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return None
+
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep):
+        """Delete least recently used PDFs until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.pdf'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except OSError:
+                    # Another worker evicted it first
+                    pass
+                total -= size
+
+    def get_or_render(self, key, render):
+        """
+        Return the cached PDF for a key, rendering and caching it on a miss
+
+        Args:
+            key: Cache key from order_pdf_key() or quote_pdf_key()
+            render: Callable returning the rendered PDF as a file object
+
+        Returns:
+            Path of the cached PDF, or the rendered file object if it was not
+            cached; either can be passed to send_file
+        """
+        if not self.max_bytes:
+            return render()
+
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        pdf = render()
+        path = self.put(key, pdf)
+        if path is None:
+            pdf.seek(0)
+            return pdf
+        pdf.close()
+        return path
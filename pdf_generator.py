@@ -1,55 +1,150 @@
-import os
 import tempfile
 import io
+import functools
 from datetime import datetime
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib.pagesizes import inch
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak, Flowable
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 import qrcode
 from PIL import Image as PILImage
-from models import SavedPrice
+from price_book import get_price_book
 
-def generate_qr_code(data):
-    """Generate a QR code image for the given data and return as a ReportLab Image"""
-    if not data or data == 'N/A':
-        return None
-    
-    # Create QR code instance
+# PDFs larger than this are moved out of worker memory into an anonymous
+# temporary file while they are sent
+PDF_SPOOL_THRESHOLD = 8 * 1024 * 1024
+
+def _pdf_output(buffer):
+    """
+    Rewind a rendered PDF for sending or storing
+    
+    ReportLab assembles the whole document in memory before writing it, so
+    PDFs are rendered straight into a BytesIO. Large ones are copied to an
+    unnamed temporary file, which the OS removes as soon as it is closed.
+    
+    Returns:
+        Binary file object positioned at the start of the PDF; the caller
+        (or send_file) closes it
+    """
+    if buffer.getbuffer().nbytes <= PDF_SPOOL_THRESHOLD:
+        buffer.seek(0)
+        return buffer
+    
+    spool = tempfile.TemporaryFile(suffix=".pdf")
+    spool.write(buffer.getbuffer())
+    spool.seek(0)
+    buffer.close()
+    return spool
+
+# Number of encoded QR codes kept in memory; pull sheets repeat the same SKUs
+QR_CACHE_SIZE = 1024
+
+@functools.lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_code_png(data, box_size=10, border=4, error_correction=qrcode.constants.ERROR_CORRECT_L):
+    """
+    Encode data as a QR code PNG, reusing recently encoded codes
+    
+    Args:
+        data: Text to encode
+        box_size: Pixels per QR module
+        border: Quiet zone width in modules
+        error_correction: qrcode.constants.ERROR_CORRECT_* level
+    
+    Returns:
+        PNG image as bytes
+    """
     qr = qrcode.QRCode(
         version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        error_correction=error_correction,
+        box_size=box_size,
+        border=border,
     )
-    
-    # Add data to the QR code
     qr.add_data(data)
     qr.make(fit=True)
     
-    # Create PIL image
     qr_img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert PIL image to reportlab Image
     img_bytes = io.BytesIO()
     qr_img.save(img_bytes, format='PNG')
-    img_bytes.seek(0)
+    return img_bytes.getvalue()
+
+@functools.lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_code_runs(data, border=4, error_correction=qrcode.constants.ERROR_CORRECT_L):
+    """
+    Lay out data as a QR code module matrix, reusing recently encoded codes
+    
+    Returns:
+        Tuple of (modules per side including the border, tuple of (x, y, length)
+        runs of dark modules along each row, with y counted up from the bottom)
+    """
+    qr = qrcode.QRCode(version=1, error_correction=error_correction, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    
+    matrix = qr.get_matrix()
+    modules = len(matrix)
+    runs = []
+    for row_index, row in enumerate(matrix):
+        y = modules - 1 - row_index
+        x = 0
+        while x < modules:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < modules and row[x]:
+                x += 1
+            runs.append((start, y, x - start))
+    return modules, tuple(runs)
+
+class QRCodeFlowable(Flowable):
+    """
+    QR code drawn as vector shapes straight onto the canvas
+    
+    Each run of dark modules in a row becomes one rectangle of a single filled
+    path, so the code stays sharp at any print resolution without an image.
+    """
+    
+    def __init__(self, data, size):
+        super().__init__()
+        self.modules, self.runs = qr_code_runs(data)
+        self.size = size
+    
+    def wrap(self, available_width, available_height):
+        return self.size, self.size
+    
+    def draw(self):
+        scale = self.size / self.modules
+        self.canv.setFillColor(colors.black)
+        path = self.canv.beginPath()
+        for x, y, length in self.runs:
+            path.rect(x * scale, y * scale, length * scale, scale)
+        self.canv.drawPath(path, stroke=0, fill=1)
+
+def generate_qr_code(data, size=0.8*inch):
+    """
+    Generate a vector QR code for the given data as a ReportLab flowable
+    
+    Args:
+        data: Text to encode
+        size: Width and height of the code in points
+    """
+    if not data or data == 'N/A':
+        return None
     
-    return Image(img_bytes, width=0.8*inch, height=0.8*inch)
+    return QRCodeFlowable(data, size)
 
 def generate_order_form(order):
-    """Generate a PDF order form for the given order"""
+    """Generate a PDF order form for the given order and return it as an open file object"""
     
-    # Create a temporary file for the PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    temp_file.close()
+    # Render the PDF in memory
+    buffer = io.BytesIO()
     
     # Create the PDF document
     doc = SimpleDocTemplate(
-        temp_file.name,
+        buffer,
         pagesize=letter,
         rightMargin=72,
         leftMargin=72,
@@ -171,21 +266,20 @@ def generate_order_form(order):
     # Build the PDF document
     doc.build(content)
     
-    return temp_file.name
+    return _pdf_output(buffer)
 
 def generate_pull_sheet(order):
-    """Generate a PDF material pull sheet for the given order on a 4"x6" page size with QR codes"""
+    """Generate a PDF material pull sheet for the given order on a 4"x6" page size with QR codes, returned as an open file object"""
     
-    # Create a temporary file for the PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    temp_file.close()
+    # Render the PDF in memory
+    buffer = io.BytesIO()
     
     # Define a custom page size (4" x 6")
     four_by_six = (4*inch, 6*inch)
     
     # Create the PDF document with 4x6 page size
     doc = SimpleDocTemplate(
-        temp_file.name,
+        buffer,
         pagesize=four_by_six,
         rightMargin=0.15*inch,
         leftMargin=0.15*inch,
@@ -291,7 +385,7 @@ def generate_pull_sheet(order):
                 
                 # Safely access the saved_price relationship
                 if hasattr(material, 'saved_price_id') and material.saved_price_id:
-                    saved_price = SavedPrice.query.get(material.saved_price_id)
+                    saved_price = get_price_book().saved_price(material.saved_price_id)
                     if saved_price and saved_price.sku:
                         material_sku = saved_price.sku
                 
@@ -299,19 +393,14 @@ def generate_pull_sheet(order):
                 if material_sku == 'N/A':
                     material_sku = item_sku
                 
-                # Always generate QR code for the SKU or item name if SKU not available
+                # Always generate QR code for the SKU or item name if SKU not available,
+                # at a smaller size for the 3-up layout
                 qr_code = None
                 if material_sku and material_sku != 'N/A':
-                    qr_code = generate_qr_code(material_sku)
+                    qr_code = generate_qr_code(material_sku, size=0.5*inch)
                 else:
                     # Use material name as a fallback for QR code
-                    qr_code = generate_qr_code(material.material_name)
-                
-                # Use smaller size for QR code for 3-up layout
-                qr_code_size = 0.5*inch
-                if qr_code:
-                    qr_code._width = qr_code_size
-                    qr_code._height = qr_code_size
+                    qr_code = generate_qr_code(material.material_name, size=0.5*inch)
                 
                 # Create more compact header row with QR code and material info
                 header_data = [[
@@ -379,18 +468,17 @@ def generate_pull_sheet(order):
     # Build the PDF document
     doc.build(content)
     
-    return temp_file.name
+    return _pdf_output(buffer)
 
 def generate_quote_pdf(quote):
-    """Generate a PDF quote for the given quote"""
+    """Generate a PDF quote for the given quote and return it as an open file object"""
     
-    # Create a temporary file for the PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    temp_file.close()
+    # Render the PDF in memory
+    buffer = io.BytesIO()
     
     # Create the PDF document
     doc = SimpleDocTemplate(
-        temp_file.name,
+        buffer,
         pagesize=letter,
         rightMargin=72,
         leftMargin=72,
@@ -553,23 +641,20 @@ def generate_quote_pdf(quote):
     # Build the PDF document
     doc.build(content)
     
-    return temp_file.name
+    return _pdf_output(buffer)
 
 def generate_pickup_receipt(order):
-    """Generate a PDF receipt with signature for the picked-up order"""
-    from models import OrderFile
-    from app import db
+    """Generate a PDF receipt with signature for the picked-up order and return it as an open file object"""
     from datetime import datetime
     import base64, re
     from io import BytesIO
     
-    # Create a temporary file for the PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    temp_file.close()
+    # Render the PDF in memory
+    buffer = io.BytesIO()
     
     # Create the PDF document
     doc = SimpleDocTemplate(
-        temp_file.name,
+        buffer,
         pagesize=letter,
         rightMargin=72,
         leftMargin=72,
@@ -710,18 +795,4 @@ def generate_pickup_receipt(order):
     # Build the PDF document
     doc.build(content)
     
-    # Create OrderFile record to store the receipt
-    receipt_file = OrderFile(
-        order_id=order.id,
-        file_type='receipt',
-        original_filename=f"receipt_{order.order_number}.pdf",
-        file_path=temp_file.name,
-        file_size=os.path.getsize(temp_file.name),
-        uploaded_by="System",
-        description=f"Pickup receipt generated on {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    )
-    
-    db.session.add(receipt_file)
-    db.session.commit()
-    
-    return receipt_file
+    return _pdf_output(buffer)
@@ -0,0 +1,344 @@
+"""
+Process-local price book
+
+Paper options, print pricing, finishing options and saved prices change
+rarely but are read on every calculator API call and quote item edit. The
+price book loads all of them once into immutable snapshot rows, indexed by id
+and by the attributes the app looks them up by.
+
+Every ORM write to a pricing table bumps the shared pricing_version row in the
+same transaction. Each request reads that counter once (a primary key lookup)
+and reloads the book when it has moved, so every worker process picks up a
+change on its next request. Edits made with raw SQL outside the app should
+call bump_pricing_version() and commit.
+
+A session that has bumped the version sees its own uncommitted pricing rows,
+which may yet be rolled back, so until it commits or rolls back it is given a
+price book of its own rather than replacing the shared one.
+"""
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from flask import g, has_app_context, has_request_context
+from sqlalchemy import event, insert, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import PaperOption, PrintPricing, FinishingOption, SavedPrice, SavedPriceMaterial, PricingVersion
+
+logger = logging.getLogger(__name__)
+
+PRICING_MODELS = (PaperOption, PrintPricing, FinishingOption, SavedPrice, SavedPriceMaterial)
+
+PRICING_VERSION_ID = 1
+
+# session.info key set while a session holds an uncommitted version bump
+PRICING_BUMP_KEY = 'pricing_version_bumped'
+
+# Print pricing rows that apply to any paper size
+GENERIC_PAPER_SIZES = ('Any', 'Universal')
+
+
+def _row_type(model):
+    """Build an immutable row type carrying the model's column attributes"""
+    return namedtuple(f'{model.__name__}Row', [attr.key for attr in model.__mapper__.column_attrs])
+
+
+class PaperOptionRow(_row_type(PaperOption)):
+    __slots__ = ()
+    get_sqft = PaperOption.get_sqft
+    get_total_roll_sqft = PaperOption.get_total_roll_sqft
+
+
+PrintPricingRow = _row_type(PrintPricing)
+FinishingOptionRow = _row_type(FinishingOption)
+SavedPriceRow = _row_type(SavedPrice)
+SavedPriceMaterialRow = _row_type(SavedPriceMaterial)
+
+
+def _load_rows(model, row_type):
+    """Load every row of a pricing table as snapshot rows in id order"""
+    columns = [getattr(model, field) for field in row_type._fields]
+    return tuple(row_type(*row) for row in db.session.query(*columns).order_by(model.id).all())
+
+
+def _sort_key(*values):
+    """Sort key that orders None first, as SQLite's ORDER BY does"""
+    return tuple((value is not None, value) for value in values)
+
+
+def _group(rows, attr):
+    """Group rows by an attribute, keeping id order within each group"""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[getattr(row, attr)].append(row)
+    return {key: tuple(value) for key, value in groups.items()}
+
+
+def _first_by(rows, key_func):
+    """Index rows by key, keeping the lowest id for duplicate keys"""
+    index = {}
+    for row in rows:
+        index.setdefault(key_func(row), row)
+    return index
+
+
+def finishing_price(option, quantity):
+    """
+    Price a finishing option for a quantity of pieces
+
+    Args:
+        option: FinishingOption or finishing option row
+        quantity: Number of pieces
+
+    Returns:
+        Base price plus the per-piece price, raised to the minimum price
+    """
+    price = option.base_price or 0
+    if (option.price_per_piece or 0) > 0:
+        price += option.price_per_piece * quantity
+    if (option.minimum_price or 0) > 0 and price < option.minimum_price:
+        price = option.minimum_price
+    return price
+
+
+class PriceBook:
+    """Immutable snapshot of every pricing table with lookup indexes"""
+
+    def __init__(self, version, paper_options, print_pricing, finishing_options, saved_prices, saved_price_materials):
+        self.version = version
+        self.paper_options = paper_options
+        self.print_pricing = print_pricing
+        self.finishing_options = finishing_options
+        self.saved_prices = saved_prices
+
+        self._paper_by_id = {paper.id: paper for paper in paper_options}
+        self._paper_by_category = _group(paper_options, 'category')
+        self._paper_by_spec = _first_by(paper_options, lambda p: (p.size, p.category, p.weight, p.color))
+        self._paper_by_weight = _first_by(paper_options, lambda p: (p.size, p.category, p.weight))
+        self._paper_by_type = _first_by(paper_options, lambda p: (p.size, p.category))
+
+        self._pricing_by_id = {pricing.id: pricing for pricing in print_pricing}
+        self._pricing_by_color = _group(print_pricing, 'color_type')
+        self._pricing_by_size_color = _first_by(print_pricing, lambda p: (p.paper_size, p.color_type))
+
+        self._finishing_by_id = {option.id: option for option in finishing_options}
+        self._finishing_by_name = _first_by(finishing_options, lambda f: f.name)
+        self._finishing_by_category = _group(finishing_options, 'category')
+
+        self._saved_price_by_id = {price.id: price for price in saved_prices}
+        self._saved_price_by_name = _first_by(saved_prices, lambda s: s.name)
+        self._saved_price_by_name_category = _first_by(saved_prices, lambda s: (s.name, s.category))
+        self._saved_price_by_category = {
+            category: tuple(sorted(prices, key=lambda s: _sort_key(s.name)))
+            for category, prices in _group(saved_prices, 'category').items()
+        }
+        self._materials_by_saved_price = _group(saved_price_materials, 'saved_price_id')
+
+    @classmethod
+    def load(cls, version):
+        """Load a price book from the database"""
+        return cls(
+            version,
+            _load_rows(PaperOption, PaperOptionRow),
+            _load_rows(PrintPricing, PrintPricingRow),
+            _load_rows(FinishingOption, FinishingOptionRow),
+            _load_rows(SavedPrice, SavedPriceRow),
+            _load_rows(SavedPriceMaterial, SavedPriceMaterialRow),
+        )
+
+    @staticmethod
+    def distinct_values(rows, attr):
+        """Sorted distinct non-empty values of an attribute across rows"""
+        return sorted({getattr(row, attr) for row in rows if getattr(row, attr)})
+
+    # Paper options
+
+    def paper(self, paper_id):
+        return self._paper_by_id.get(paper_id)
+
+    def papers(self, category=None):
+        """Paper options in id order, optionally restricted to a category"""
+        if category:
+            return self._paper_by_category.get(category, ())
+        return self.paper_options
+
+    def papers_sorted(self, *fields):
+        """Paper options ordered by the given fields, category and name by default"""
+        fields = fields or ('category', 'name')
+        return sorted(self.paper_options, key=lambda p: _sort_key(*(getattr(p, f) for f in fields)))
+
+    def find_paper(self, size, category, weight=None, color=None):
+        """
+        Find the paper option best matching a job's paper specification
+
+        Tries size, type, weight and color first, then drops color, then weight.
+        """
+        paper = None
+        if weight and color:
+            paper = self._paper_by_spec.get((size, category, weight, color))
+        if not paper and weight:
+            paper = self._paper_by_weight.get((size, category, weight))
+        if not paper:
+            paper = self._paper_by_type.get((size, category))
+        return paper
+
+    # Print pricing
+
+    def pricing(self, pricing_id):
+        return self._pricing_by_id.get(pricing_id)
+
+    def pricing_for(self, color_type=None):
+        """Print pricing rows in id order, optionally restricted to a color type"""
+        if color_type:
+            return self._pricing_by_color.get(color_type, ())
+        return self.print_pricing
+
+    def find_print_pricing(self, paper_size, color_type):
+        """Print pricing for a paper size and color, falling back to generic sizes"""
+        pricing = self._pricing_by_size_color.get((paper_size, color_type))
+        if not pricing:
+            pricing = next((p for p in self.pricing_for(color_type) if p.paper_size in GENERIC_PAPER_SIZES), None)
+        return pricing
+
+    # Finishing options
+
+    def finishing_option(self, option_id):
+        return self._finishing_by_id.get(option_id)
+
+    def finishing_option_named(self, name):
+        return self._finishing_by_name.get(name)
+
+    def finishing_options_for(self, category=None):
+        """Finishing options in id order, optionally restricted to a category"""
+        if category:
+            return self._finishing_by_category.get(category, ())
+        return self.finishing_options
+
+    def finishing_options_sorted(self):
+        """Finishing options ordered by category and name"""
+        return sorted(self.finishing_options, key=lambda f: _sort_key(f.category, f.name))
+
+    # Saved prices
+
+    def saved_price(self, saved_price_id):
+        return self._saved_price_by_id.get(saved_price_id)
+
+    def find_saved_price(self, name, category=None):
+        """Look up a saved price by name, and by category when one is given"""
+        if category is None:
+            return self._saved_price_by_name.get(name)
+        return self._saved_price_by_name_category.get((name, category))
+
+    def saved_prices_for(self, category=None):
+        """Saved prices ordered by name within a category, or by category and name"""
+        if category:
+            return self._saved_price_by_category.get(category, ())
+        return sorted(self.saved_prices, key=lambda s: _sort_key(s.category, s.name))
+
+    def saved_prices_in(self, categories):
+        """Saved prices in any of the given categories, ordered by category and name"""
+        rows = [row for category in categories for row in self._saved_price_by_category.get(category, ())]
+        return sorted(rows, key=lambda s: _sort_key(s.category, s.name))
+
+    def materials_for(self, saved_price_id):
+        """Template materials of a saved price in id order"""
+        return self._materials_by_saved_price.get(saved_price_id, ())
+
+
+_book = None
+_book_lock = threading.Lock()
+
+
+def current_pricing_version():
+    """Read the shared pricing version, at most once per request"""
+    if has_request_context() and 'pricing_version' in g:
+        return g.pricing_version
+    version = db.session.query(PricingVersion.version).filter_by(id=PRICING_VERSION_ID).scalar() or 0
+    if has_request_context():
+        g.pricing_version = version
+    return version
+
+
+def get_price_book():
+    """Return the price book, reloading it if the pricing tables have changed"""
+    global _book
+    version = current_pricing_version()
+    if db.session.info.get(PRICING_BUMP_KEY):
+        # Uncommitted pricing writes must not reach the shared book
+        return PriceBook.load(version)
+    book = _book
+    if book is None or book.version != version:
+        with _book_lock:
+            if _book is None or _book.version != version:
+                _book = PriceBook.load(version)
+                logger.debug(f"Loaded price book version {version}")
+            book = _book
+    return book
+
+
+def bump_pricing_version(session=None):
+    """Mark the pricing tables as changed so every process reloads its price book"""
+    session = session or db.session
+    table = PricingVersion.__table__
+    connection = session.connection()
+    result = connection.execute(
+        update(table)
+        .where(table.c.id == PRICING_VERSION_ID)
+        .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        # The counter row is missing (e.g. tables recreated), start it over
+        connection.execute(insert(table).values(id=PRICING_VERSION_ID, version=1, updated_at=datetime.utcnow()))
+    session.info[PRICING_BUMP_KEY] = True
+    if has_app_context():
+        g.pop('pricing_version', None)
+
+
+def _touches_pricing(session):
+    """Whether a pending flush inserts, changes or deletes any pricing row"""
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, PRICING_MODELS):
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, PRICING_MODELS) and session.is_modified(obj):
+            return True
+    return False
+
+
+@event.listens_for(db.session, 'before_flush')
+def bump_on_pricing_write(session, flush_context, instances):
+    if _touches_pricing(session):
+        bump_pricing_version(session)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def bump_on_bulk_pricing_write(orm_execute_state):
+    # query.update()/query.delete() skip the flush but still go through here
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, PRICING_MODELS):
+            bump_pricing_version(orm_execute_state.session)
+
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_rollback')
+def end_pricing_bump(session):
+    # The version read inside the transaction may have been rolled back
+    if session.info.pop(PRICING_BUMP_KEY, None) and has_app_context():
+        g.pop('pricing_version', None)
+
+
+def ensure_pricing_version():
+    """Create the pricing_version row if it does not exist yet"""
+    if db.session.get(PricingVersion, PRICING_VERSION_ID) is not None:
+        return
+    db.session.add(PricingVersion(id=PRICING_VERSION_ID, version=0))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker process created it first
+        db.session.rollback()
+
+
+ensure_pricing_version()
@@ -0,0 +1,14 @@
+"""
+Rebuild the daily revenue/cost rollup table
+
+Recomputes every daily_rollup row from the order history. The app backfills
+the table itself on its first start after an upgrade; run this after bulk
+edits made outside the app.
+"""
+from app import app
+from daily_rollup import rebuild_daily_rollup
+
+if __name__ == "__main__":
+    with app.app_context():
+        row_count = rebuild_daily_rollup()
+        print(f"Daily rollup rebuilt: {row_count} rows written.")
@@ -0,0 +1,392 @@
+"""
+Report engine for computing revenue, material cost and profit in SQL
+
+The reports used to walk order -> items -> materials -> saved price in Python,
+which issued one lazy query per relationship hop. Everything here is done with
+a handful of grouped queries that work on both SQLite and PostgreSQL.
+"""
+from datetime import date, datetime, timedelta
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import case, desc, func
+from sqlalchemy.orm import joinedload
+from app import db
+from models import Customer, Order, DailyRollup
+from cost_rollup import material_cost_subquery
+
+
+def _margin(profit, revenue):
+    """Profit margin as a percentage, 0 when there is no revenue"""
+    return (profit / revenue * 100) if revenue > 0 else 0
+
+
+def profitability_report():
+    """
+    Build the data for the profitability report
+
+    Returns:
+        dict with the orders list (customer eager-loaded), per-order costs,
+        overall totals and per-customer profitability
+    """
+    costs = material_cost_subquery()
+
+    # Per-order material cost
+    order_costs = dict(
+        db.session.query(costs.c.order_id, costs.c.material_cost).all()
+    )
+
+    # Orders for the detail table, with customers loaded in the same query
+    orders = (
+        Order.query
+        .options(joinedload(Order.customer))
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .all()
+    )
+    for order in orders:
+        order_costs.setdefault(order.id, 0)
+
+    # Revenue and cost grouped by customer
+    customer_rows = (
+        db.session.query(
+            Customer.id,
+            Customer.name,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_price), 0),
+            func.coalesce(func.sum(costs.c.material_cost), 0)
+        )
+        .join(Order, Order.customer_id == Customer.id)
+        .outerjoin(costs, costs.c.order_id == Order.id)
+        .group_by(Customer.id, Customer.name)
+        .order_by(Customer.name)
+        .all()
+    )
+
+    customer_profitability = {}
+    total_revenue = 0
+    total_cost = 0
+    for customer_id, name, order_count, revenue, cost in customer_rows:
+        profit = revenue - cost
+        customer_profitability[customer_id] = {
+            'name': name,
+            'order_count': order_count,
+            'revenue': revenue,
+            'cost': cost,
+            'profit': profit,
+            'margin': _margin(profit, revenue)
+        }
+        total_revenue += revenue
+        total_cost += cost
+
+    total_profit = total_revenue - total_cost
+
+    return {
+        'orders': orders,
+        'order_costs': order_costs,
+        'total_revenue': total_revenue,
+        'total_cost': total_cost,
+        'total_profit': total_profit,
+        'profit_margin': _margin(total_profit, total_revenue),
+        'customer_profitability': customer_profitability,
+    }
+
+
+# Sort keys accepted by customers_report, mapped to their ORDER BY column;
+# ties and 'name' fall back to customer name
+CUSTOMER_SORT_OPTIONS = {
+    'revenue': desc('revenue'),
+    'profit': desc('profit'),
+    'margin': desc('margin'),
+    'name': None,
+}
+
+
+class CountedPagination(Pagination):
+    """Pagination fetching one page with LIMIT/OFFSET and the total with a separate COUNT query"""
+
+    def _query_items(self):
+        return self._query_args['query'].limit(self.per_page).offset(self._query_offset).all()
+
+    def _query_count(self):
+        return self._query_args['count_query'].scalar()
+
+
+def customers_report(sort='revenue', page=1, per_page=50):
+    """
+    Build the data for the all customers report
+
+    Order count, revenue and material cost per customer are summed from the
+    daily rollup, so no order or material rows are scanned. Sorting and paging
+    happen in SQL, and only the customers on the requested page are loaded.
+
+    Args:
+        sort: One of CUSTOMER_SORT_OPTIONS; revenue, profit and margin sort descending
+        page: 1-based page number
+        per_page: Customers per page
+
+    Returns:
+        dict with the page of customers, their figures keyed by customer id,
+        the pagination object and overall totals
+    """
+    if sort not in CUSTOMER_SORT_OPTIONS:
+        sort = 'revenue'
+
+    totals = (
+        db.session.query(
+            DailyRollup.customer_id.label('customer_id'),
+            func.sum(DailyRollup.order_count).label('order_count'),
+            func.sum(DailyRollup.revenue).label('revenue'),
+            func.sum(DailyRollup.material_cost).label('cost')
+        )
+        .group_by(DailyRollup.customer_id)
+        .subquery()
+    )
+    revenue = func.coalesce(totals.c.revenue, 0)
+    cost = func.coalesce(totals.c.cost, 0)
+    profit = revenue - cost
+
+    query = (
+        Customer.query
+        .add_columns(
+            func.coalesce(totals.c.order_count, 0).label('order_count'),
+            revenue.label('revenue'),
+            cost.label('cost'),
+            profit.label('profit'),
+            case((revenue > 0, profit * 100.0 / revenue), else_=0).label('margin')
+        )
+        .outerjoin(totals, totals.c.customer_id == Customer.id)
+    )
+    sort_column = CUSTOMER_SORT_OPTIONS[sort]
+    if sort_column is not None:
+        query = query.order_by(sort_column)
+    query = query.order_by(Customer.name, Customer.id)
+
+    pagination = CountedPagination(page=page, per_page=per_page, max_per_page=None, error_out=False,
+                                   query=query, count_query=db.session.query(func.count(Customer.id)))
+
+    customers = []
+    customer_data = {}
+    for customer, order_count, customer_revenue, customer_cost, customer_profit, margin in pagination.items:
+        customers.append(customer)
+        customer_data[customer.id] = {
+            'name': customer.name,
+            'order_count': order_count,
+            'revenue': customer_revenue,
+            'cost': customer_cost,
+            'profit': customer_profit,
+            'margin': margin
+        }
+
+    total_revenue, total_cost = db.session.query(
+        func.coalesce(func.sum(DailyRollup.revenue), 0),
+        func.coalesce(func.sum(DailyRollup.material_cost), 0)
+    ).one()
+    total_profit = total_revenue - total_cost
+
+    return {
+        'customers': customers,
+        'customer_data': customer_data,
+        'customer_count': pagination.total,
+        'pagination': pagination,
+        'sort': sort,
+        'total_revenue': total_revenue,
+        'total_cost': total_cost,
+        'total_profit': total_profit,
+        'profit_margin': _margin(total_profit, total_revenue),
+    }
+
+
+def _rollup_query(customer_id=None, start_date=None, end_date=None):
+    """Base daily_rollup query filtered by customer and inclusive date range"""
+    query = db.session.query(DailyRollup)
+    if customer_id is not None:
+        query = query.filter(DailyRollup.customer_id == customer_id)
+    if start_date is not None:
+        query = query.filter(DailyRollup.date >= start_date)
+    if end_date is not None:
+        query = query.filter(DailyRollup.date <= end_date)
+    return query
+
+
+def rollup_by_period(period_format, customer_id=None, start_date=None, end_date=None):
+    """
+    Chart data by period read from the pre-aggregated daily rollup
+
+    Args:
+        period_format: strftime format naming the period, e.g. '%Y-%m' or '%Y'
+        customer_id: Optional customer to restrict to
+        start_date, end_date: Optional inclusive date bounds
+
+    Returns:
+        dict mapping period -> order_count, revenue, cost and profit
+    """
+    rows = (
+        _rollup_query(customer_id, start_date, end_date)
+        .with_entities(
+            DailyRollup.date,
+            func.sum(DailyRollup.order_count),
+            func.sum(DailyRollup.revenue),
+            func.sum(DailyRollup.material_cost)
+        )
+        .group_by(DailyRollup.date)
+        .order_by(DailyRollup.date)
+        .all()
+    )
+
+    period_data = {}
+    for day, order_count, revenue, cost in rows:
+        period = day.strftime(period_format)
+        if period not in period_data:
+            period_data[period] = {
+                'order_count': 0,
+                'revenue': 0,
+                'cost': 0,
+                'profit': 0
+            }
+        period_data[period]['order_count'] += order_count
+        period_data[period]['revenue'] += revenue
+        period_data[period]['cost'] += cost
+        period_data[period]['profit'] += revenue - cost
+    return period_data
+
+
+def rollup_by_customer(start_date=None, end_date=None):
+    """
+    Per-customer figures for a date range read from the daily rollup
+
+    Returns:
+        dict mapping customer id -> name, order_count, revenue, cost and profit
+    """
+    rows = (
+        _rollup_query(None, start_date, end_date)
+        .join(Customer, Customer.id == DailyRollup.customer_id)
+        .with_entities(
+            Customer.id,
+            Customer.name,
+            func.sum(DailyRollup.order_count),
+            func.sum(DailyRollup.revenue),
+            func.sum(DailyRollup.material_cost)
+        )
+        .group_by(Customer.id, Customer.name)
+        .order_by(Customer.name)
+        .all()
+    )
+    return {
+        customer_id: {
+            'name': name,
+            'order_count': order_count,
+            'revenue': revenue,
+            'cost': cost,
+            'profit': revenue - cost
+        }
+        for customer_id, name, order_count, revenue, cost in rows
+    }
+
+
+# Aging buckets for accounts receivable, in template key order
+AGING_BUCKETS = ('current', 'days_1_30', 'days_31_60', 'days_61_90', 'days_over_90')
+
+
+def receivables_report(today=None, include_zero_balance=False):
+    """
+    Build the data for the accounts receivable report
+
+    Aging is measured from the due date (or creation date when no due date is
+    set) and bucketed in SQL with a CASE expression, so the work scales with
+    the number of open invoices rather than with orders or customers.
+
+    Args:
+        today: Date to age against, defaults to today
+        include_zero_balance: Also return a lazily loaded iterable of
+            customers that owe nothing
+
+    Returns:
+        dict with per-customer balances, outstanding orders grouped by
+        customer, bucket totals and percentages
+    """
+    today = today or date.today()
+    midnight = datetime.combine(today, datetime.min.time())
+
+    invoice_date = func.coalesce(Order.due_date, Order.created_at)
+    outstanding = func.coalesce(Order.total_price, 0) - func.coalesce(Order.amount_paid, 0)
+    balance_due = case((outstanding > 0, outstanding), else_=0)
+    bucket = case(
+        (invoice_date >= midnight, 'current'),
+        (invoice_date >= midnight - timedelta(days=30), 'days_1_30'),
+        (invoice_date >= midnight - timedelta(days=60), 'days_31_60'),
+        (invoice_date >= midnight - timedelta(days=90), 'days_61_90'),
+        else_='days_over_90'
+    )
+    open_orders = (
+        Order.payment_status.in_(['unpaid', 'partial']),
+        outstanding > 0
+    )
+
+    # Balances per customer and aging bucket in one grouped query
+    rows = (
+        db.session.query(
+            Customer.id,
+            Customer.name,
+            Customer.email,
+            *[func.sum(case((bucket == name, balance_due), else_=0)) for name in AGING_BUCKETS]
+        )
+        .join(Order, Order.customer_id == Customer.id)
+        .filter(*open_orders)
+        .group_by(Customer.id, Customer.name, Customer.email)
+        .order_by(Customer.name)
+        .all()
+    )
+
+    customer_balances = {}
+    bucket_totals = dict.fromkeys(AGING_BUCKETS, 0)
+    for customer_id, name, email, *amounts in rows:
+        data = {'name': name, 'email': email}
+        data.update(zip(AGING_BUCKETS, amounts))
+        data['total_due'] = sum(amounts)
+        customer_balances[customer_id] = data
+        for bucket_name, amount in zip(AGING_BUCKETS, amounts):
+            bucket_totals[bucket_name] += amount
+
+    # Open invoices for the per-customer detail tables, oldest first
+    outstanding_orders = (
+        Order.query
+        .filter(*open_orders)
+        .order_by(invoice_date, Order.id)
+        .all()
+    )
+    orders_by_customer = {}
+    for order in outstanding_orders:
+        invoice_day = (order.due_date or order.created_at).date()
+        order.days_outstanding = (today - invoice_day).days
+        orders_by_customer.setdefault(order.customer_id, []).append(order)
+
+    zero_balance_customers = []
+    if include_zero_balance:
+        zero_balance_customers = (
+            Customer.query
+            .filter(Customer.id.notin_(list(customer_balances)))
+            .order_by(Customer.name)
+            .yield_per(500)
+        )
+
+    total_receivable = sum(bucket_totals.values())
+    total = total_receivable or 1  # Avoid division by zero
+
+    return {
+        'customer_balances': customer_balances,
+        'outstanding_orders': outstanding_orders,
+        'orders_by_customer': orders_by_customer,
+        'zero_balance_customers': zero_balance_customers,
+        'include_zero_balance': include_zero_balance,
+        'total_receivable': total_receivable,
+        'current_receivable': bucket_totals['current'],
+        'days_1_30': bucket_totals['days_1_30'],
+        'days_31_60': bucket_totals['days_31_60'],
+        'days_61_90': bucket_totals['days_61_90'],
+        'days_over_90': bucket_totals['days_over_90'],
+        'current_percentage': bucket_totals['current'] / total * 100,
+        'days_1_30_percentage': bucket_totals['days_1_30'] / total * 100,
+        'days_31_60_percentage': bucket_totals['days_31_60'] / total * 100,
+        'days_61_90_percentage': bucket_totals['days_61_90'] / total * 100,
+        'days_over_90_percentage': bucket_totals['days_over_90'] / total * 100,
+        'customers_with_balance': len(customer_balances),
+        'overdue_receivable': total_receivable - bucket_totals['current'],
+    }
@@ -2,15 +2,31 @@ import os
 import uuid
 import logging
 import functools
+import gzip
+import hashlib
+import threading
+import time
+import mimetypes
+import unicodedata
+from collections import namedtuple
+from urllib.parse import quote as url_quote
 from datetime import datetime, timedelta
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, abort, g, Response, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, abort, g, make_response, Response, session
 from werkzeug.utils import secure_filename
-from sqlalchemy import text
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from app import app, db
 from models import User, Customer, Order, OrderItem, ItemMaterial, OrderFile, OrderActivity, SavedPrice, SavedPriceMaterial, Quote, QuoteItem, QuoteItemMaterial, FinishingOption, PaperOption, PrintPricing
 from nextcloud_client import NextcloudClient
 from pdf_generator import generate_order_form, generate_pull_sheet, generate_quote_pdf, generate_pickup_receipt, generate_qr_code
 from email_service import send_proof_approval_email
+from report_engine import profitability_report, customers_report, rollup_by_period, rollup_by_customer, receivables_report
+from cost_rollup import order_material_costs, material_usage_rows
+from price_book import get_price_book, current_pricing_version, finishing_price
+from file_store import acquire_blob, release_blob, delete_order_files
+from pdf_cache import PDFCache, order_pdf_key, quote_pdf_key
+from batch_print import DOCUMENTS, BATCH_MAX_ORDERS, batch_orders_query, start_batch_job, read_batch_job, batch_job_pdf
 from flask_wtf.csrf import CSRFProtect
 import io
 import qrcode
@@ -58,7 +74,13 @@ if app.config['NEXTCLOUD_URL'] and app.config['NEXTCLOUD_USERNAME'] and app.conf
         app.config['NEXTCLOUD_URL'],
         username,  # Use the possibly modified username
         app.config['NEXTCLOUD_PASSWORD'],
-        app.config['NEXTCLOUD_FOLDER']
+        app.config['NEXTCLOUD_FOLDER'],
+        pool_size=app.config['NEXTCLOUD_POOL_SIZE'],
+        timeouts=app.config['NEXTCLOUD_TIMEOUTS'],
+        connect_timeout=app.config['NEXTCLOUD_CONNECT_TIMEOUT'],
+        folder_cache_ttl=app.config['NEXTCLOUD_FOLDER_CACHE_TTL'],
+        chunk_size=app.config['NEXTCLOUD_CHUNK_SIZE'],
+        chunk_workers=app.config['NEXTCLOUD_CHUNK_WORKERS']
     )
 else:
     # Create dummy client that will log errors instead of failing
@@ -74,10 +96,18 @@ else:
             self.logger.error("Nextcloud not configured. File download failed.")
             return None
             
+        def open_download(self, file_path, range_header=None, if_range=None):
+            self.logger.error("Nextcloud not configured. File download failed.")
+            return None
+            
         def delete_file(self, file_path):
             self.logger.error("Nextcloud not configured. File deletion failed.")
             return False
             
+        def delete_files(self, file_paths, workers=None):
+            self.logger.error("Nextcloud not configured. File deletion failed.")
+            return {file_path: False for file_path in file_paths}
+            
         def list_files(self, folder_path=""):
             self.logger.error("Nextcloud not configured. Cannot list files.")
             return []
@@ -101,28 +131,79 @@ class CurrentUser:
 # Create a global instance
 current_user = CurrentUser()
 
-# Setup default admin user for all requests (since we've removed authentication)
+# Identity snapshot kept in the per-process user cache
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'email', 'role'])
+
+class UserCache:
+    """
+    Per-process cache of logged-in users so requests need no identity query
+    
+    Entries expire after ttl seconds, which bounds how long another worker
+    process can serve a stale user. Changes made in this process evict the
+    entry immediately through the mapper events below.
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, user_id):
+        """Return the cached user, loading it from the database on a miss"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry and entry[1] > now:
+            return entry[0]
+        
+        user = db.session.get(User, user_id)
+        cached = CachedUser(user.id, user.username, user.email, user.role) if user else None
+        with self._lock:
+            self._entries[user_id] = (cached, now + self.ttl)
+        return cached
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+user_cache = UserCache(ttl=int(os.environ.get('USER_CACHE_TTL', 60)))
+
+pdf_cache = PDFCache(app.config['PDF_CACHE_DIR'], app.config['PDF_CACHE_MAX_BYTES'])
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+def ensure_default_admin():
+    """Create the default admin user if no users exist yet"""
+    if db.session.query(User.id).first() is not None:
+        return
+    
+    default_admin = User(
+        username="admin",
+        email="admin@example.com",
+        role="admin"
+    )
+    default_admin.set_password("password123")
+    db.session.add(default_admin)
+    try:
+        db.session.commit()
+        app.logger.info("Created default admin user")
+    except IntegrityError:
+        # Another worker process created it first
+        db.session.rollback()
+
+# Bootstrap the default admin once at startup rather than on every request
+ensure_default_admin()
+
 @app.before_request
 def load_logged_in_user():
     # Check if user is logged in
     user_id = session.get('user_id')
     if user_id:
-        g.user = User.query.get(user_id)
+        g.user = user_cache.get(user_id)
     else:
         g.user = None
 
-    # Create default admin user if no users exist
-    if User.query.count() == 0:
-        default_admin = User(
-            username="admin",
-            email="admin@example.com",
-            role="admin"
-        )
-        default_admin.set_password("password123")
-        db.session.add(default_admin)
-        db.session.commit()
-        app.logger.info("Created default admin user")
-
 # Login route
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -289,17 +370,122 @@ def customers_edit(id):
     return render_template('customers/edit.html', customer=customer, form=form)
 
 # Order routes
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 200
+
+def _order_list_filters():
+    """Read the order list filters from the query string"""
+    return {
+        'status': request.args.get('status', 'all'),
+        'payment_status': request.args.get('payment_status', 'all'),
+        'customer_id': request.args.get('customer_id', type=int),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+
+def _filtered_orders_query(filters):
+    """Build the order list query with every filter applied in SQL"""
+    query = Order.query.options(joinedload(Order.customer))
+    
+    if filters['status'] != 'all':
+        query = query.filter(Order.status == filters['status'])
+    if filters['payment_status'] != 'all':
+        query = query.filter(Order.payment_status == filters['payment_status'])
+    if filters['customer_id']:
+        query = query.filter(Order.customer_id == filters['customer_id'])
+    
+    # Date filters are on the creation date, both ends inclusive
+    try:
+        if filters['date_from']:
+            query = query.filter(Order.created_at >= datetime.strptime(filters['date_from'], '%Y-%m-%d'))
+        if filters['date_to']:
+            date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1)
+            query = query.filter(Order.created_at < date_to)
+    except ValueError:
+        abort(400)
+    
+    return query.order_by(Order.created_at.desc(), Order.id.desc())
+
+def _encode_order_cursor(order):
+    """Keyset cursor pointing just after the given order"""
+    return f"{order.created_at.isoformat()}_{order.id}"
+
+def _decode_order_cursor(cursor):
+    """Parse a cursor from _encode_order_cursor into (created_at, id)"""
+    try:
+        created_at, order_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        abort(400)
+
+def _order_list_page(filters, cursor=None, limit=ORDERS_PAGE_SIZE):
+    """
+    Fetch one page of the order list using keyset pagination on (created_at, id)
+    
+    Returns:
+        tuple of (orders, next_cursor); next_cursor is None on the last page
+    """
+    query = _filtered_orders_query(filters)
+    
+    if cursor:
+        created_at, order_id = _decode_order_cursor(cursor)
+        query = query.filter(db.or_(
+            Order.created_at < created_at,
+            db.and_(Order.created_at == created_at, Order.id < order_id)
+        ))
+    
+    # Fetch one extra row to learn whether another page follows
+    orders = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = _encode_order_cursor(orders[-1])
+    
+    return orders, next_cursor
+
 @app.route('/orders')
 @login_required
 def orders_index():
-    status_filter = request.args.get('status', 'all')
+    filters = _order_list_filters()
+    limit = max(1, min(request.args.get('limit', ORDERS_PAGE_SIZE, type=int), ORDERS_MAX_PAGE_SIZE))
+    orders, next_cursor = _order_list_page(filters, request.args.get('cursor'), limit)
+    customers = db.session.query(Customer.id, Customer.name).order_by(Customer.name).all()
     
-    if status_filter == 'all':
-        orders = Order.query.order_by(Order.created_at.desc()).all()
-    else:
-        orders = Order.query.filter_by(status=status_filter).order_by(Order.created_at.desc()).all()
+    return render_template('orders/index.html',
+                           orders=orders,
+                           next_cursor=next_cursor,
+                           filters=filters,
+                           customers=customers,
+                           current_filter=filters['status'])
+
+@app.route('/api/orders', methods=['GET'])
+@login_required
+def api_orders():
+    """Return a page of the filtered order list as JSON for infinite scrolling"""
+    filters = _order_list_filters()
+    limit = max(1, min(request.args.get('limit', ORDERS_PAGE_SIZE, type=int), ORDERS_MAX_PAGE_SIZE))
+    orders, next_cursor = _order_list_page(filters, request.args.get('cursor'), limit)
     
-    return render_template('orders/index.html', orders=orders, current_filter=status_filter)
+    result = []
+    for order in orders:
+        result.append({
+            'id': order.id,
+            'order_number': order.order_number,
+            'customer_id': order.customer_id,
+            'customer_name': order.customer.name,
+            'title': order.title,
+            'status': order.status,
+            'payment_status': order.payment_status,
+            'due_date': order.due_date.strftime('%Y-%m-%d') if order.due_date else None,
+            'created_at': order.created_at.strftime('%Y-%m-%d'),
+            'total_price': float(order.total_price) if order.total_price else 0.0,
+            'view_url': url_for('orders_view', id=order.id),
+            'edit_url': url_for('orders_edit', id=order.id),
+            'order_form_url': url_for('generate_pdf_order_form', order_id=order.id),
+            'pull_sheet_url': url_for('generate_pdf_pull_sheet', order_id=order.id)
+        })
+    
+    return jsonify({'orders': result, 'next_cursor': next_cursor})
 
 @app.route('/orders/create', methods=['GET', 'POST'])
 @login_required
@@ -427,13 +613,7 @@ def orders_edit(id):
         return redirect(url_for('orders_view', id=order.id))
     
     # Get all material type prices for the materials dropdown
-    saved_materials = SavedPrice.query.filter(
-        (SavedPrice.category == 'material') | 
-        (SavedPrice.category == 'paper') |
-        (SavedPrice.category == 'substrate') |
-        (SavedPrice.category == 'laminate') |
-        (SavedPrice.category == 'binding')
-    ).order_by(SavedPrice.category, SavedPrice.name).all()
+    saved_materials = get_price_book().saved_prices_in(['material', 'paper', 'substrate', 'laminate', 'binding'])
     
     return render_template('orders/edit.html', order=order, customers=customers, saved_materials=saved_materials, form=form)
 
@@ -496,8 +676,8 @@ def order_items_add(order_id):
                     continue
                     
                 # Try to find a saved price for this material
-                saved_price = SavedPrice.query.filter_by(name=material_names[i], 
-                    category=(material_categories[i] if i < len(material_categories) else 'other')).first()
+                saved_price = get_price_book().find_saved_price(material_names[i],
+                    material_categories[i] if i < len(material_categories) else 'other')
                     
                 # Create the material item
                 material = ItemMaterial(
@@ -638,7 +818,7 @@ def item_materials_add(item_id):
         
         if saved_material_id and saved_material_id != 'custom':
             # Adding from saved material
-            saved_price = SavedPrice.query.get_or_404(int(saved_material_id))
+            saved_price = get_price_book().saved_price(int(saved_material_id)) or abort(404)
             material_name = saved_price.name
             category = saved_price.category
             unit = saved_price.unit
@@ -654,7 +834,7 @@ def item_materials_add(item_id):
             
             # Try to find a saved price for this material
             category = request.form.get('category', 'other')
-            saved_price = SavedPrice.query.filter_by(name=material_name, category=category).first()
+            saved_price = get_price_book().find_saved_price(material_name, category)
             saved_price_id = saved_price.id if saved_price else None
         
         material = ItemMaterial(
@@ -797,21 +977,21 @@ def order_files_upload(order_id):
         if file and file.filename:
             original_filename = secure_filename(file.filename)
             file_ext = os.path.splitext(original_filename)[1]
-            filename = f"{str(uuid.uuid4())}{file_ext}"
             
-            # Upload file to Nextcloud
-            file_path = f"{order.order_number}/{filename}"
-            success = nextcloud.upload_file(file, file_path)
+            # Store the file in Nextcloud, or reuse the copy of identical contents
+            blob = acquire_blob(nextcloud, file.stream, file_ext)
             
-            if success:
+            if blob:
                 # Save file information to database
                 order_file = OrderFile(
                     order_id=order.id,
-                    filename=filename,
+                    filename=os.path.basename(blob.file_path),
                     original_filename=original_filename,
                     file_type=file_type,
-                    file_path=file_path,
-                    file_size=len(file.read()),
+                    file_path=blob.file_path,
+                    file_size=blob.file_size,
+                    content_hash=blob.content_hash,
+                    blob=blob,
                     uploaded_by=current_user.id
                 )
                 
@@ -836,20 +1016,66 @@ def order_files_upload(order_id):
     
     return render_template('files/upload.html', order=order, form=form)
 
+# Size of the pieces Nextcloud downloads are relayed in
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Upstream headers passed through to the browser unchanged
+DOWNLOAD_FORWARDED_HEADERS = ['Content-Length', 'Content-Range', 'ETag', 'Last-Modified']
+
+def stream_nextcloud_file(file_path, download_name):
+    """
+    Relay a Nextcloud file to the client as it arrives, without a local copy
+    
+    The request's Range/If-Range headers are forwarded, so browsers and
+    download managers can resume large files.
+    
+    Returns:
+        A streaming response, or None if Nextcloud could not serve the file
+    """
+    upstream = nextcloud.open_download(
+        file_path,
+        range_header=request.headers.get('Range'),
+        if_range=request.headers.get('If-Range')
+    )
+    if upstream is None:
+        return None
+    
+    def generate():
+        try:
+            for chunk in upstream.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            upstream.close()
+    
+    mimetype = upstream.headers.get('Content-Type') or \
+        mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response = Response(generate(), status=upstream.status_code, content_type=mimetype,
+                        direct_passthrough=True)
+    for header in DOWNLOAD_FORWARDED_HEADERS:
+        if header in upstream.headers:
+            response.headers[header] = upstream.headers[header]
+    response.headers['Accept-Ranges'] = 'bytes'
+    
+    # Same Content-Disposition encoding as send_file
+    try:
+        download_name.encode('ascii')
+        disposition = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple_name = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        disposition = {'filename': simple_name, 'filename*': f"UTF-8''{url_quote(download_name, safe='!#$&+^`|~')}"}
+    response.headers.set('Content-Disposition', 'attachment', **disposition)
+    return response
+
 @app.route('/files/<int:file_id>/download')
 @login_required
 def files_download(file_id):
     order_file = OrderFile.query.get_or_404(file_id)
     
-    # Download file from Nextcloud
-    temp_file_path = nextcloud.download_file(order_file.file_path)
+    # Stream the file from Nextcloud
+    response = stream_nextcloud_file(order_file.file_path, order_file.original_filename)
     
-    if temp_file_path:
-        return send_file(
-            temp_file_path,
-            download_name=order_file.original_filename,
-            as_attachment=True
-        )
+    if response:
+        return response
     else:
         flash('Failed to download file from Nextcloud', 'danger')
         return redirect(url_for('order_files_index', order_id=order_file.order_id))
@@ -880,9 +1106,15 @@ def files_delete(file_id):
         # Set up enhanced logging
         logging.getLogger('nextcloud_client').setLevel(logging.DEBUG)
         
-        # Delete file from Nextcloud
-        app.logger.debug(f"Calling nextcloud.delete_file({order_file.file_path})")
-        success = nextcloud.delete_file(order_file.file_path)
+        # Delete file from Nextcloud; shared contents are only removed with their last reference
+        if order_file.blob:
+            # The stored copy is deleted once the commit below succeeds
+            app.logger.debug(f"Releasing blob {order_file.blob.content_hash} ({order_file.file_path})")
+            release_blob(nextcloud, order_file.blob)
+            success = True
+        else:
+            app.logger.debug(f"Calling nextcloud.delete_file({order_file.file_path})")
+            success = nextcloud.delete_file(order_file.file_path)
         
         if success:
             app.logger.debug(f"Nextcloud file deletion returned success")
@@ -911,14 +1143,56 @@ def files_delete(file_id):
     
     return redirect(url_for('order_files_index', order_id=order_id))
 
+@app.route('/orders/<int:order_id>/files/delete-all', methods=['POST'])
+@login_required
+def order_files_delete_all(order_id):
+    from flask_wtf import FlaskForm
+    
+    # Create a simple form for CSRF protection
+    class FileDeleteForm(FlaskForm):
+        pass
+    
+    form = FileDeleteForm()
+    order = Order.query.get_or_404(order_id)
+    
+    if not form.validate_on_submit():
+        flash('Invalid form submission. CSRF token missing or invalid.', 'danger')
+        return redirect(url_for('order_files_index', order_id=order_id))
+    
+    try:
+        # Delete every file from Nextcloud concurrently; files that fail are kept
+        deleted, kept = delete_order_files(nextcloud, list(order.files))
+        
+        for order_file in deleted:
+            activity = OrderActivity(
+                order_id=order.id,
+                user_id=current_user.id,
+                activity_type='file_deleted',
+                description=f'File "{order_file.original_filename}" deleted'
+            )
+            db.session.add(activity)
+        db.session.commit()
+        
+        if kept:
+            app.logger.error(f"Nextcloud file deletion failed for {[f.file_path for f in kept]}")
+            flash(f'{len(deleted)} files deleted, {len(kept)} could not be deleted from Nextcloud. Check application logs for details.', 'warning')
+        else:
+            flash(f'{len(deleted)} files deleted successfully', 'success')
+    except Exception as e:
+        app.logger.error(f"Exception during bulk file deletion: {str(e)}")
+        flash(f'An error occurred while deleting the files: {str(e)}', 'danger')
+        db.session.rollback()
+    
+    return redirect(url_for('order_files_index', order_id=order_id))
+
 # PDF generation routes
 @app.route('/orders/<int:order_id>/pdf/order-form')
 @login_required
 def generate_pdf_order_form(order_id):
     order = Order.query.get_or_404(order_id)
     
-    # Generate PDF order form
-    pdf_file = generate_order_form(order)
+    # Generate PDF order form, or reuse the copy rendered from identical data
+    pdf_file = pdf_cache.get_or_render(order_pdf_key(order, 'order-form'), lambda: generate_order_form(order))
     
     # Create activity log
     activity = OrderActivity(
@@ -941,8 +1215,8 @@ def generate_pdf_order_form(order_id):
 def generate_pdf_pull_sheet(order_id):
     order = Order.query.get_or_404(order_id)
     
-    # Generate PDF pull sheet
-    pdf_file = generate_pull_sheet(order)
+    # Generate PDF pull sheet, or reuse the copy rendered from identical data
+    pdf_file = pdf_cache.get_or_render(order_pdf_key(order, 'pull-sheet'), lambda: generate_pull_sheet(order))
     
     # Create activity log
     activity = OrderActivity(
@@ -960,6 +1234,68 @@ def generate_pdf_pull_sheet(order_id):
         as_attachment=True
     )
 
+@app.route('/orders/pdf/batch', methods=['POST'])
+@login_required
+def generate_pdf_batch():
+    """Start printing the order forms and pull sheets of every matching order as one PDF"""
+    status = request.form.get('status', 'all')
+    customer_id = request.form.get('customer_id', type=int)
+    try:
+        due_from = datetime.strptime(request.form['due_from'], '%Y-%m-%d').date() if request.form.get('due_from') else None
+        due_to = datetime.strptime(request.form['due_to'], '%Y-%m-%d').date() if request.form.get('due_to') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid due date'}), 400
+    documents = [d for d in DOCUMENTS if d in request.form.getlist('documents')] or list(DOCUMENTS)
+    
+    query = batch_orders_query(None if status == 'all' else status, customer_id, due_from, due_to)
+    order_ids = [row.id for row in query.with_entities(Order.id).limit(BATCH_MAX_ORDERS + 1)]
+    if not order_ids:
+        return jsonify({'success': False, 'error': 'No orders match the batch print filter'}), 400
+    if len(order_ids) > BATCH_MAX_ORDERS:
+        return jsonify({'success': False, 'error': f'More than {BATCH_MAX_ORDERS} orders match; narrow the batch print filter'}), 400
+    
+    job_id = start_batch_job(order_ids, documents, current_user.id)
+    return jsonify({
+        'success': True,
+        'total': len(order_ids),
+        'status_url': url_for('pdf_batch_status', job_id=job_id),
+    }), 202
+
+def _user_batch_job(job_id):
+    """Status of one of the current user's batch print jobs, or 404"""
+    job = read_batch_job(job_id)
+    if job is None or job['user_id'] != current_user.id:
+        abort(404)
+    return job
+
+@app.route('/orders/pdf/batch/<job_id>')
+@login_required
+def pdf_batch_status(job_id):
+    """Progress of a batch print job, with a download URL once it is done"""
+    job = _user_batch_job(job_id)
+    return jsonify({
+        'state': job['state'],
+        'done': job['done'],
+        'total': job['total'],
+        'error': job['error'],
+        'download_url': url_for('download_pdf_batch', job_id=job_id) if job['state'] == 'done' else None,
+    })
+
+@app.route('/orders/pdf/batch/<job_id>/download')
+@login_required
+def download_pdf_batch(job_id):
+    """Merged PDF of a finished batch print job"""
+    job = _user_batch_job(job_id)
+    pdf_path = batch_job_pdf(job_id)
+    if job['state'] != 'done' or not os.path.exists(pdf_path):
+        abort(404)
+    return send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        download_name=job['download_name'],
+        as_attachment=True
+    )
+
 # Order status update API
 @app.route('/api/orders/<int:order_id>/status', methods=['POST'])
 @login_required
@@ -1095,7 +1431,7 @@ def saved_prices_create():
                     
                     if paper_id:
                         # Get the paper option from database
-                        paper_option = PaperOption.query.get(paper_id)
+                        paper_option = get_price_book().paper(paper_id)
                         
                         if paper_option:
                             # Format paper name
@@ -1118,7 +1454,7 @@ def saved_prices_create():
                     # Regular material
                     try:
                         material_id = int(template_material_ids[i])
-                        material_price = SavedPrice.query.get(material_id)
+                        material_price = get_price_book().saved_price(material_id)
                         
                         if not material_price:
                             continue
@@ -1224,7 +1560,7 @@ def saved_prices_edit(id):
                     
                     if paper_id:
                         # Get the paper option from database
-                        paper_option = PaperOption.query.get(paper_id)
+                        paper_option = get_price_book().paper(paper_id)
                         
                         if paper_option:
                             # Format paper name
@@ -1247,7 +1583,7 @@ def saved_prices_edit(id):
                     # Regular material
                     try:
                         material_id = int(template_material_ids[i])
-                        material_price = SavedPrice.query.get(material_id)
+                        material_price = get_price_book().saved_price(material_id)
                         
                         if not material_price:
                             continue
@@ -1319,7 +1655,7 @@ def saved_prices_edit(id):
                 })
             else:
                 # Try to find the linked material by name
-                linked_material = SavedPrice.query.filter_by(name=tm.material_name).first()
+                linked_material = get_price_book().find_saved_price(tm.material_name)
                 material_id = linked_material.id if linked_material else 0
                 
                 template_materials.append({
@@ -1885,8 +2221,69 @@ def download_comprehensive_template():
 
 # API endpoints for quote calculator
 
+# Responses smaller than this are not worth compressing
+PRICING_API_GZIP_MIN_SIZE = 500
+PRICING_API_BODY_CACHE_SIZE = 64
+
+# Serialized (and possibly gzipped) bodies keyed by ETag; reset on pricing changes
+_pricing_api_bodies = {}
+_pricing_api_bodies_version = None
+
+def pricing_api_cache(view):
+    """
+    Make a pricing JSON API cacheable by browsers
+
+    The strong ETag is derived from the pricing_version counter, the request
+    path and query and the content encoding, so a matching If-None-Match gets
+    a 304 without building the catalog again. Bodies are gzipped for clients
+    that accept it and kept per ETag until the pricing tables change.
+    """
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        global _pricing_api_bodies_version
+
+        version = current_pricing_version()
+        use_gzip = 'gzip' in request.accept_encodings
+        digest = hashlib.sha256(f"{version}:{request.full_path}".encode()).hexdigest()[:32]
+        etag = f"{digest}-gz" if use_gzip else digest
+
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            if _pricing_api_bodies_version != version:
+                _pricing_api_bodies.clear()
+                _pricing_api_bodies_version = version
+
+            cached = _pricing_api_bodies.get(etag)
+            if cached is None:
+                inner = make_response(view(*args, **kwargs))
+                if inner.status_code != 200:
+                    return inner
+                body = inner.get_data()
+                encoding = None
+                if use_gzip and len(body) >= PRICING_API_GZIP_MIN_SIZE:
+                    body = gzip.compress(body, compresslevel=6)
+                    encoding = 'gzip'
+                cached = (body, encoding)
+                if len(_pricing_api_bodies) >= PRICING_API_BODY_CACHE_SIZE:
+                    _pricing_api_bodies.clear()
+                _pricing_api_bodies[etag] = cached
+
+            body, encoding = cached
+            response = Response(body, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        # Always revalidate; unchanged catalogs come back as an empty 304
+        response.headers['Cache-Control'] = 'public, no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+    return wrapped
+
 # API to get paper options for the quote calculator
 @app.route('/api/paper-options', methods=['GET'])
+@pricing_api_cache
 def api_paper_options():
     """Return all paper options as JSON for the price calculator"""
     # Debug output
@@ -1897,9 +2294,9 @@ def api_paper_options():
     
     if paper_type:
         app.logger.debug(f"Filtering by paper type: {paper_type}")
-        options = PaperOption.query.filter_by(category=paper_type).all()
+        options = get_price_book().papers(paper_type)
     else:
-        options = PaperOption.query.all()
+        options = get_price_book().papers()
     
     app.logger.debug(f"Found {len(options)} paper options")
     
@@ -1929,6 +2326,7 @@ def api_paper_options():
 
 # API to get print pricing options - public API
 @app.route('/api/print-pricing', methods=['GET'])
+@pricing_api_cache
 def api_print_pricing():
     """Return all print pricing options as JSON for the price calculator"""
     # Debug output
@@ -1939,9 +2337,9 @@ def api_print_pricing():
     
     if color_type:
         app.logger.debug(f"Filtering by color type: {color_type}")
-        pricing = PrintPricing.query.filter_by(color_type=color_type).all()
+        pricing = get_price_book().pricing_for(color_type)
     else:
-        pricing = PrintPricing.query.all()
+        pricing = get_price_book().pricing_for()
     
     app.logger.debug(f"Found {len(pricing)} print pricing options")
     
@@ -1977,11 +2375,12 @@ def api_test():
 
 # API to get finishing option categories - public API
 @app.route('/api/finishing-categories', methods=['GET'])
+@pricing_api_cache
 def api_finishing_categories():
     """Return all unique finishing option categories as JSON"""
     app.logger.debug("API request for finishing categories received")
-    # Get all finishing options from database
-    options = FinishingOption.query.all()
+    # Get all finishing options from the price book
+    options = get_price_book().finishing_options
     app.logger.debug(f"Found {len(options)} finishing options in database")
     
     # Extract unique categories
@@ -1999,6 +2398,7 @@ def api_finishing_categories():
 
 # API to get finishing options for the quote calculator - public API
 @app.route('/api/finishing-options', methods=['GET'])
+@pricing_api_cache
 def api_finishing_options():
     """Return all finishing options as JSON for the price calculator"""
     app.logger.debug("API request for finishing options received")
@@ -2007,10 +2407,10 @@ def api_finishing_options():
     app.logger.debug(f"Finishing options category filter: {category}")
     
     if category:
-        options = FinishingOption.query.filter_by(category=category).all()
+        options = get_price_book().finishing_options_for(category)
         app.logger.debug(f"Found {len(options)} finishing options for category '{category}'")
     else:
-        options = FinishingOption.query.all()
+        options = get_price_book().finishing_options_for()
         app.logger.debug(f"Found {len(options)} finishing options across all categories")
     
     # Convert to JSON
@@ -2034,14 +2434,13 @@ def api_finishing_options():
 
 # API to retrieve saved prices for order form
 @app.route('/api/saved-prices', methods=['GET'])
+@pricing_api_cache
 def api_saved_prices():
     category = request.args.get('category')
     include_materials = request.args.get('include_materials', 'false').lower() == 'true'
     
-    if category:
-        prices = SavedPrice.query.filter_by(category=category).order_by(SavedPrice.name).all()
-    else:
-        prices = SavedPrice.query.order_by(SavedPrice.category, SavedPrice.name).all()
+    book = get_price_book()
+    prices = book.saved_prices_for(category)
     
     # Convert to JSON serializable format
     result = []
@@ -2061,7 +2460,7 @@ def api_saved_prices():
         # Include materials if requested and this is a template
         if include_materials and price.is_template:
             price_data['materials'] = []
-            for material in price.materials:
+            for material in book.materials_for(price.id):
                 price_data['materials'].append({
                     'id': material.id,
                     'material_name': material.material_name,
@@ -2078,17 +2477,19 @@ def api_saved_prices():
 
 # API to retrieve saved materials by category
 @app.route('/api/materials', methods=['GET'])
+@pricing_api_cache
 def api_materials():
     category = request.args.get('category', 'all')
     
     # Query saved prices where category is 'material' or the specific category
+    materials = get_price_book().saved_prices_for('material')
     if category != 'all':
-        materials = SavedPrice.query.filter_by(category='material').filter(
-            SavedPrice.name.like(f'%{category}%') | 
-            SavedPrice.description.like(f'%{category}%')
-        ).order_by(SavedPrice.name).all()
-    else:
-        materials = SavedPrice.query.filter_by(category='material').order_by(SavedPrice.name).all()
+        # Case-insensitive substring match, as SQL LIKE does
+        needle = category.lower()
+        materials = [
+            material for material in materials
+            if needle in (material.name or '').lower() or needle in (material.description or '').lower()
+        ]
     
     # Convert to JSON serializable format
     result = []
@@ -2145,8 +2546,8 @@ def quotes_create():
     form = QuoteForm()
     item_form = QuoteItemForm()
     customers = Customer.query.order_by(Customer.name).all()
-    paper_options = PaperOption.query.order_by(PaperOption.category, PaperOption.name).all()
-    finishing_options = FinishingOption.query.order_by(FinishingOption.category, FinishingOption.name).all()
+    paper_options = get_price_book().papers_sorted()
+    finishing_options = get_price_book().finishing_options_sorted()
     
     if request.method == 'POST' and form.validate_on_submit():
         app.logger.info("Starting quote creation process")
@@ -2404,8 +2805,8 @@ def quotes_edit(id):
     item_form = QuoteItemAddForm()
     quote = Quote.query.get_or_404(id)
     customers = Customer.query.order_by(Customer.name).all()
-    paper_options = PaperOption.query.order_by(PaperOption.category, PaperOption.name).all()
-    finishing_options = FinishingOption.query.order_by(FinishingOption.category, FinishingOption.name).all()
+    paper_options = get_price_book().papers_sorted()
+    finishing_options = get_price_book().finishing_options_sorted()
     
     if request.method == 'POST' and form.validate_on_submit():
         quote.customer_id = request.form.get('customer_id')
@@ -2522,8 +2923,8 @@ def quotes_delete(id):
 def generate_pdf_quote(id):
     quote = Quote.query.get_or_404(id)
     
-    # Generate PDF quote
-    pdf_file = generate_quote_pdf(quote)
+    # Generate PDF quote, or reuse the copy rendered from identical data
+    pdf_file = pdf_cache.get_or_render(quote_pdf_key(quote), lambda: generate_quote_pdf(quote))
     
     return send_file(
         pdf_file,
@@ -2555,8 +2956,8 @@ def quote_items_add(quote_id):
     form = QuoteItemAddForm()
     quote = Quote.query.get_or_404(quote_id)
     customers = Customer.query.order_by(Customer.name).all()
-    paper_options = PaperOption.query.order_by(PaperOption.category, PaperOption.name).all()
-    finishing_options = FinishingOption.query.order_by(FinishingOption.category, FinishingOption.name).all()
+    paper_options = get_price_book().papers_sorted()
+    finishing_options = get_price_book().finishing_options_sorted()
     
     # Show the redesigned form interface for GET requests
     if request.method == 'GET':
@@ -2643,20 +3044,9 @@ def quote_items_add(quote_id):
         
         if finishing_option_list:
             for option_name in finishing_option_list:
-                option = FinishingOption.query.filter_by(name=option_name).first()
+                option = get_price_book().finishing_option_named(option_name)
                 if option:
-                    option_cost = option.base_price
-                    
-                    # Add per-piece price multiplied by quantity
-                    if option.per_piece_price > 0:
-                        option_cost += option.per_piece_price * quantity
-                    
-                    # Apply minimum price if needed
-                    if option.min_price > 0 and option_cost < option.min_price:
-                        option_cost = option.min_price
-                    
-                    # Add to total finishing cost
-                    finishing_cost += option_cost
+                    finishing_cost += finishing_price(option, quantity)
         
         # Update total price with finishing costs
         quote_item.total_price = quantity * unit_price + finishing_cost
@@ -2674,31 +3064,8 @@ def quote_items_add(quote_id):
         
         # Attempt to find a matching paper option to associate with this quote item
         if paper_size and paper_type:
-            paper_option = None
-            
-            # First try exact match on all criteria
-            if paper_weight and paper_color:
-                paper_option = PaperOption.query.filter(
-                    PaperOption.size == paper_size,
-                    PaperOption.category == paper_type,
-                    PaperOption.weight == paper_weight,
-                    PaperOption.color == paper_color
-                ).first()
-            
-            # If not found, try without color
-            if not paper_option and paper_weight:
-                paper_option = PaperOption.query.filter(
-                    PaperOption.size == paper_size,
-                    PaperOption.category == paper_type,
-                    PaperOption.weight == paper_weight
-                ).first()
-            
-            # If still not found, try just size and type
-            if not paper_option:
-                paper_option = PaperOption.query.filter(
-                    PaperOption.size == paper_size,
-                    PaperOption.category == paper_type
-                ).first()
+            # Match on all criteria, falling back to fewer
+            paper_option = get_price_book().find_paper(paper_size, paper_type, paper_weight, paper_color)
             
             # If we found a paper option, associate it with the quote item
             if paper_option:
@@ -2748,7 +3115,7 @@ def quote_item_materials_add(item_id):
         
         if saved_material_id and saved_material_id != 'custom':
             # Adding from saved material
-            saved_price = SavedPrice.query.get_or_404(int(saved_material_id))
+            saved_price = get_price_book().saved_price(int(saved_material_id)) or abort(404)
             material_name = saved_price.name
             category = saved_price.category
             unit = saved_price.unit
@@ -2764,7 +3131,7 @@ def quote_item_materials_add(item_id):
             
             # Try to find a saved price for this material
             category = request.form.get('category', 'other')
-            saved_price = SavedPrice.query.filter_by(name=material_name, category=category).first()
+            saved_price = get_price_book().find_saved_price(material_name, category)
             saved_price_id = saved_price.id if saved_price else None
         
         material = QuoteItemMaterial(
@@ -2810,7 +3177,7 @@ def quote_item_materials_edit(material_id):
         # Check if we're changing to a saved price
         saved_material_id = request.form.get('saved_material_id')
         if saved_material_id and saved_material_id != 'custom':
-            saved_price = SavedPrice.query.get_or_404(int(saved_material_id))
+            saved_price = get_price_book().saved_price(int(saved_material_id)) or abort(404)
             material.material_name = saved_price.name
             material.category = saved_price.category
             material.unit = saved_price.unit
@@ -2888,22 +3255,10 @@ def quote_items_update(item_id):
         finishing_cost = 0
         if finishing_option_list:
             for option_name in finishing_option_list:
-                # Look up finishing option details from database
-                option = FinishingOption.query.filter_by(name=option_name).first()
+                # Look up finishing option details from the price book
+                option = get_price_book().finishing_option_named(option_name)
                 if option:
-                    # Calculate the cost for this option
-                    option_cost = option.base_price
-                    
-                    # Add per-piece price multiplied by quantity
-                    if option.price_per_piece > 0:
-                        option_cost += option.price_per_piece * item.quantity
-                    
-                    # Apply minimum price if needed
-                    if option.minimum_price > 0 and option_cost < option.minimum_price:
-                        option_cost = option.minimum_price
-                    
-                    # Add to total finishing cost
-                    finishing_cost += option_cost
+                    finishing_cost += finishing_price(option, item.quantity)
         
         # Add finishing costs to total price
         item.total_price += finishing_cost
@@ -3040,24 +3395,11 @@ def quote_items_edit(item_id):
     finishing_cost = 0
     if finishing_option_list:
         for option_name in finishing_option_list:
-            # Look up finishing option details from database
-            option = FinishingOption.query.filter_by(name=option_name).first()
+            # Look up finishing option details from the price book
+            option = get_price_book().finishing_option_named(option_name)
             if option:
-                # Calculate the cost for this option
-                option_cost = option.base_price
-                
-                # Add per-piece price multiplied by quantity
-                if option.price_per_piece > 0:
-                    option_cost += option.price_per_piece * item.quantity
-                
                 # For future: add per-sqft calculations if needed
-                
-                # Apply minimum price if needed
-                if option.minimum_price > 0 and option_cost < option.minimum_price:
-                    option_cost = option.minimum_price
-                
-                # Add to total finishing cost
-                finishing_cost += option_cost
+                finishing_cost += finishing_price(option, item.quantity)
     
     # Calculate total price including finishing costs
     total_price = base_price + finishing_cost
@@ -3427,15 +3769,11 @@ def proof_download(token):
     # Find the file by token
     file = OrderFile.query.filter_by(approval_token=token).first_or_404()
     
-    # Download file from Nextcloud
-    temp_file_path = nextcloud.download_file(file.file_path)
+    # Stream the file from Nextcloud
+    response = stream_nextcloud_file(file.file_path, file.original_filename)
     
-    if temp_file_path:
-        return send_file(
-            temp_file_path,
-            download_name=file.original_filename,
-            as_attachment=True
-        )
+    if response:
+        return response
     else:
         flash('Failed to download file', 'danger')
         return redirect(url_for('proof_view', token=token))
@@ -3570,66 +3908,8 @@ def reports_index():
 @login_required
 def reports_profitability():
     """Profitability report showing cost vs. profit analysis"""
-    # Get all orders
-    orders = Order.query.all()
-    
-    # Calculate costs for each order
-    order_costs = {}
-    total_revenue = 0
-    total_cost = 0
-    
-    for order in orders:
-        # Calculate material costs for this order
-        order_cost = 0
-        for item in order.items:
-            for material in item.materials:
-                # If this material has a saved price with a cost price, use that
-                if material.saved_price and material.saved_price.cost_price:
-                    material_cost = material.saved_price.cost_price * material.quantity
-                    order_cost += material_cost
-        
-        order_costs[order.id] = order_cost
-        total_revenue += order.total_price
-        total_cost += order_cost
-    
-    # Calculate profit and margin
-    total_profit = total_revenue - total_cost
-    profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
-    
-    # Calculate profitability by customer
-    customer_profitability = {}
-    
-    for order in orders:
-        customer_id = order.customer_id
-        customer_name = order.customer.name
-        
-        if customer_id not in customer_profitability:
-            customer_profitability[customer_id] = {
-                'name': customer_name,
-                'order_count': 0,
-                'revenue': 0,
-                'cost': 0,
-                'profit': 0,
-                'margin': 0
-            }
-        
-        customer_profitability[customer_id]['order_count'] += 1
-        customer_profitability[customer_id]['revenue'] += order.total_price
-        customer_profitability[customer_id]['cost'] += order_costs[order.id]
-    
-    # Calculate profit and margin for each customer
-    for customer_id, data in customer_profitability.items():
-        data['profit'] = data['revenue'] - data['cost']
-        data['margin'] = (data['profit'] / data['revenue'] * 100) if data['revenue'] > 0 else 0
-    
-    return render_template('reports/profitability.html',
-                           orders=orders,
-                           order_costs=order_costs,
-                           total_revenue=total_revenue,
-                           total_cost=total_cost,
-                           total_profit=total_profit,
-                           profit_margin=profit_margin,
-                           customer_profitability=customer_profitability)
+    report = profitability_report()
+    return render_template('reports/profitability.html', **report)
 
 @app.route('/reports/customer')
 @login_required
@@ -3650,44 +3930,20 @@ def reports_customer():
     quotes = Quote.query.filter_by(customer_id=customer_id).all()
     
     # Calculate order costs
-    order_costs = {}
     total_revenue = 0
     total_cost = 0
     
+    order_costs = order_material_costs(order.id for order in orders)
     for order in orders:
-        # Calculate material costs for this order
-        order_cost = 0
-        for item in order.items:
-            for material in item.materials:
-                # If this material has a saved price with a cost price, use that
-                if material.saved_price and material.saved_price.cost_price:
-                    material_cost = material.saved_price.cost_price * material.quantity
-                    order_cost += material_cost
-        
-        order_costs[order.id] = order_cost
         total_revenue += order.total_price
-        total_cost += order_cost
+        total_cost += order_costs[order.id]
     
     # Calculate profit and margin
     total_profit = total_revenue - total_cost
     profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
     
-    # Prepare yearly data for charts
-    yearly_data = {}
-    for order in orders:
-        year = order.created_at.strftime('%Y')
-        if year not in yearly_data:
-            yearly_data[year] = {
-                'order_count': 0,
-                'revenue': 0,
-                'cost': 0,
-                'profit': 0
-            }
-        
-        yearly_data[year]['order_count'] += 1
-        yearly_data[year]['revenue'] += order.total_price
-        yearly_data[year]['cost'] += order_costs[order.id]
-        yearly_data[year]['profit'] += (order.total_price - order_costs[order.id])
+    # Prepare yearly data for charts from the daily rollup
+    yearly_data = rollup_by_period('%Y', customer_id=customer.id)
     
     return render_template('reports/customer.html',
                            customer=customer,
@@ -3705,63 +3961,12 @@ def reports_customer():
 @login_required
 def reports_customers():
     """Report for all customers"""
-    customers = Customer.query.order_by(Customer.name).all()
-    
-    # Prepare customer data
-    customer_data = {}
-    total_revenue = 0
-    total_cost = 0
-    
-    for customer in customers:
-        # Get all orders for this customer
-        orders = Order.query.filter_by(customer_id=customer.id).all()
-        
-        # Calculate costs and revenue
-        customer_revenue = 0
-        customer_cost = 0
-        
-        for order in orders:
-            customer_revenue += order.total_price
-            
-            # Calculate material costs for this order
-            order_cost = 0
-            for item in order.items:
-                for material in item.materials:
-                    # If this material has a saved price with a cost price, use that
-                    if material.saved_price and material.saved_price.cost_price:
-                        material_cost = material.saved_price.cost_price * material.quantity
-                        order_cost += material_cost
-            
-            customer_cost += order_cost
-        
-        # Calculate profit and margin
-        customer_profit = customer_revenue - customer_cost
-        customer_margin = (customer_profit / customer_revenue * 100) if customer_revenue > 0 else 0
-        
-        customer_data[customer.id] = {
-            'name': customer.name,
-            'order_count': len(orders),
-            'revenue': customer_revenue,
-            'cost': customer_cost,
-            'profit': customer_profit,
-            'margin': customer_margin
-        }
-        
-        total_revenue += customer_revenue
-        total_cost += customer_cost
+    sort = request.args.get('sort', 'revenue')
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 500)
     
-    # Calculate totals
-    total_profit = total_revenue - total_cost
-    profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
-    
-    return render_template('reports/customers.html',
-                           customers=customers,
-                           customer_data=customer_data,
-                           customer_count=len(customers),
-                           total_revenue=total_revenue,
-                           total_cost=total_cost,
-                           total_profit=total_profit,
-                           profit_margin=profit_margin)
+    report = customers_report(sort=sort, page=page, per_page=per_page)
+    return render_template('reports/customers.html', **report)
 
 @app.route('/reports/time-period')
 @login_required
@@ -3785,66 +3990,26 @@ def reports_time_period():
     end_date = datetime.combine(end_date.date(), datetime.max.time())
     
     # Get orders in the date range
-    orders = Order.query.filter(Order.created_at >= start_date, Order.created_at <= end_date).all()
+    orders = Order.query.options(joinedload(Order.customer)).filter(
+        Order.created_at >= start_date, Order.created_at <= end_date
+    ).all()
     
     # Calculate order costs
-    order_costs = {}
     total_revenue = 0
     total_cost = 0
     
+    order_costs = order_material_costs(order.id for order in orders)
     for order in orders:
-        # Calculate material costs for this order
-        order_cost = 0
-        for item in order.items:
-            for material in item.materials:
-                # If this material has a saved price with a cost price, use that
-                if material.saved_price and material.saved_price.cost_price:
-                    material_cost = material.saved_price.cost_price * material.quantity
-                    order_cost += material_cost
-        
-        order_costs[order.id] = order_cost
         total_revenue += order.total_price
-        total_cost += order_cost
+        total_cost += order_costs[order.id]
     
     # Calculate profit and margin
     total_profit = total_revenue - total_cost
     profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
     
-    # Prepare monthly data for charts
-    monthly_data = {}
-    for order in orders:
-        month = order.created_at.strftime('%Y-%m')
-        if month not in monthly_data:
-            monthly_data[month] = {
-                'order_count': 0,
-                'revenue': 0,
-                'cost': 0,
-                'profit': 0
-            }
-        
-        monthly_data[month]['order_count'] += 1
-        monthly_data[month]['revenue'] += order.total_price
-        monthly_data[month]['cost'] += order_costs[order.id]
-        monthly_data[month]['profit'] += (order.total_price - order_costs[order.id])
-    
-    # Prepare customer data for this period
-    customer_data = {}
-    
-    for order in orders:
-        customer_id = order.customer_id
-        if customer_id not in customer_data:
-            customer_data[customer_id] = {
-                'name': order.customer.name,
-                'order_count': 0,
-                'revenue': 0,
-                'cost': 0,
-                'profit': 0
-            }
-        
-        customer_data[customer_id]['order_count'] += 1
-        customer_data[customer_id]['revenue'] += order.total_price
-        customer_data[customer_id]['cost'] += order_costs[order.id]
-        customer_data[customer_id]['profit'] += (order.total_price - order_costs[order.id])
+    # Prepare monthly and per-customer data from the daily rollup
+    monthly_data = rollup_by_period('%Y-%m', start_date=start_date.date(), end_date=end_date.date())
+    customer_data = rollup_by_customer(start_date=start_date.date(), end_date=end_date.date())
     
     return render_template('reports/time_period.html',
                            start_date=start_date_str,
@@ -3890,54 +4055,51 @@ def reports_materials():
             start_date_str = today.replace(day=1).strftime('%Y-%m-%d')
             end_date_str = today.strftime('%Y-%m-%d')
     
+    # Fetch every material line with its cost in bulk
+    material_rows = material_usage_rows(order.id for order in orders)
+    
     # Analyze materials usage
     materials_by_name = {}
     materials_by_category = {}
     total_material_cost = 0
     
-    for order in orders:
-        for item in order.items:
-            for material in item.materials:
-                material_name = material.material_name
-                material_category = material.category or 'Other'
-                material_quantity = material.quantity or 0
-                material_unit = material.unit or 'pcs'
-                
-                # Calculate material cost
-                material_cost = 0
-                if material.saved_price and material.saved_price.cost_price:
-                    material_cost = material.saved_price.cost_price * material_quantity
-                
-                # Add to materials by name dictionary
-                if material_name not in materials_by_name:
-                    materials_by_name[material_name] = {
-                        'name': material_name,
-                        'category': material_category,
-                        'total_quantity': 0,
-                        'unit': material_unit,
-                        'total_cost': 0,
-                        'order_count': 0,
-                        'orders': set(),
-                        'id': material.id if hasattr(material, 'id') else None
-                    }
-                
-                materials_by_name[material_name]['total_quantity'] += material_quantity
-                materials_by_name[material_name]['total_cost'] += material_cost
-                materials_by_name[material_name]['orders'].add(order.id)
-                
-                # Add to materials by category dictionary
-                if material_category not in materials_by_category:
-                    materials_by_category[material_category] = {
-                        'quantity': 0,
-                        'cost': 0,
-                        'percentage': 0
-                    }
-                
-                materials_by_category[material_category]['quantity'] += material_quantity
-                materials_by_category[material_category]['cost'] += material_cost
-                
-                # Add to total cost
-                total_material_cost += material_cost
+    for material in material_rows:
+        material_name = material.material_name
+        material_category = material.category or 'Other'
+        material_quantity = material.quantity or 0
+        material_unit = material.unit or 'pcs'
+        material_cost = material.cost
+        
+        # Add to materials by name dictionary
+        if material_name not in materials_by_name:
+            materials_by_name[material_name] = {
+                'name': material_name,
+                'category': material_category,
+                'total_quantity': 0,
+                'unit': material_unit,
+                'total_cost': 0,
+                'order_count': 0,
+                'orders': set(),
+                'id': material.id
+            }
+        
+        materials_by_name[material_name]['total_quantity'] += material_quantity
+        materials_by_name[material_name]['total_cost'] += material_cost
+        materials_by_name[material_name]['orders'].add(material.order_id)
+        
+        # Add to materials by category dictionary
+        if material_category not in materials_by_category:
+            materials_by_category[material_category] = {
+                'quantity': 0,
+                'cost': 0,
+                'percentage': 0
+            }
+        
+        materials_by_category[material_category]['quantity'] += material_quantity
+        materials_by_category[material_category]['cost'] += material_cost
+        
+        # Add to total cost
+        total_material_cost += material_cost
     
     # Calculate order counts and percentages
     for material_name, data in materials_by_name.items():
@@ -3965,38 +4127,26 @@ def reports_materials():
     monthly_material_usage = {}
     
     for order in orders:
-        month = order.created_at.strftime('%Y-%m')
+        monthly_material_usage.setdefault(order.created_at.strftime('%Y-%m'), {})
+    
+    for material in material_rows:
+        month = material.created_at.strftime('%Y-%m')
+        material_id = material.id
         
-        if month not in monthly_material_usage:
-            monthly_material_usage[month] = {}
+        if material_id not in monthly_material_usage[month]:
+            monthly_material_usage[month][material_id] = {
+                'quantity': 0,
+                'cost': 0
+            }
         
-        for item in order.items:
-            for material in item.materials:
-                material_id = material.id if hasattr(material, 'id') else f"noname_{material.material_name}"
-                material_quantity = material.quantity or 0
-                
-                # Calculate material cost
-                material_cost = 0
-                if material.saved_price and material.saved_price.cost_price:
-                    material_cost = material.saved_price.cost_price * material_quantity
-                
-                if material_id not in monthly_material_usage[month]:
-                    monthly_material_usage[month][material_id] = {
-                        'quantity': 0,
-                        'cost': 0
-                    }
-                
-                monthly_material_usage[month][material_id]['quantity'] += material_quantity
-                monthly_material_usage[month][material_id]['cost'] += material_cost
+        monthly_material_usage[month][material_id]['quantity'] += material.quantity or 0
+        monthly_material_usage[month][material_id]['cost'] += material.cost
     
     # Get orders sorted by material cost
+    order_costs = order_material_costs(order.id for order in orders)
     orders_with_material_cost = []
     for order in orders:
-        material_cost = 0
-        for item in order.items:
-            for material in item.materials:
-                if material.saved_price and material.saved_price.cost_price:
-                    material_cost += material.saved_price.cost_price * (material.quantity or 0)
+        material_cost = order_costs[order.id]
         
         # Calculate percentage of total cost
         material_cost_percentage = 0
@@ -4031,7 +4181,7 @@ def reports_materials():
                            start_date=start_date_str,
                            end_date=end_date_str,
                            total_material_cost=total_material_cost,
-                           orders_with_materials_count=len([o for o in orders if any(item.materials for item in o.items)]),
+                           orders_with_materials_count=len({material.order_id for material in material_rows}),
                            unique_materials_count=len(materials_by_name),
                            materials_by_category=materials_by_category,
                            top_materials=top_materials,
@@ -4043,128 +4193,10 @@ def reports_materials():
 @login_required
 def reports_accounts_receivable():
     """Accounts receivable report showing customer balances and outstanding orders"""
-    from datetime import date, timedelta
-    
-    # Get all orders that aren't fully paid
-    orders = Order.query.filter(
-        Order.payment_status.in_(['unpaid', 'partial'])
-    ).order_by(Order.due_date).all()
-    
-    # Calculate aging for each order
-    today = date.today()
-    
-    # Initialize customer balances
-    customer_balances = {}
-    total_receivable = 0
-    current_receivable = 0
-    days_1_30 = 0
-    days_31_60 = 0
-    days_61_90 = 0
-    days_over_90 = 0
-    
-    # Process each order
-    outstanding_orders = []
-    for order in orders:
-        customer_id = order.customer_id
-        if customer_id not in customer_balances:
-            customer_balances[customer_id] = {
-                'name': order.customer.name,
-                'email': order.customer.email,
-                'total_due': 0,
-                'current': 0,
-                'days_1_30': 0, 
-                'days_31_60': 0,
-                'days_61_90': 0,
-                'days_over_90': 0
-            }
-        
-        # Calculate balance due on this order
-        balance_due = order.balance_due
-        
-        if balance_due <= 0:
-            continue  # Skip fully paid orders
-        
-        # Calculate age of the order based on due date or creation date
-        if order.due_date:
-            invoice_date = order.due_date.date()
-        else:
-            invoice_date = order.created_at.date()
-        
-        days_outstanding = (today - invoice_date).days
-        
-        # Add this order to outstanding orders list
-        order.days_outstanding = days_outstanding
-        outstanding_orders.append(order)
-        
-        # Add to customer's appropriate aging bucket
-        if days_outstanding <= 0:  # Not due yet
-            customer_balances[customer_id]['current'] += balance_due
-            current_receivable += balance_due
-        elif days_outstanding <= 30:
-            customer_balances[customer_id]['days_1_30'] += balance_due
-            days_1_30 += balance_due
-        elif days_outstanding <= 60:
-            customer_balances[customer_id]['days_31_60'] += balance_due
-            days_31_60 += balance_due
-        elif days_outstanding <= 90:
-            customer_balances[customer_id]['days_61_90'] += balance_due
-            days_61_90 += balance_due
-        else:
-            customer_balances[customer_id]['days_over_90'] += balance_due
-            days_over_90 += balance_due
-        
-        # Add to customer's total
-        customer_balances[customer_id]['total_due'] += balance_due
-        total_receivable += balance_due
-    
-    # Add all customers (even with zero balance) to the list
-    all_customers = Customer.query.all()
-    for customer in all_customers:
-        if customer.id not in customer_balances:
-            customer_balances[customer.id] = {
-                'name': customer.name,
-                'email': customer.email,
-                'total_due': 0,
-                'current': 0,
-                'days_1_30': 0, 
-                'days_31_60': 0,
-                'days_61_90': 0,
-                'days_over_90': 0
-            }
+    include_zero_balance = request.args.get('include_zero_balance') == '1'
     
-    # Sort outstanding orders by days outstanding (oldest first)
-    outstanding_orders.sort(key=lambda o: o.days_outstanding, reverse=True)
-    
-    # Calculate percentages for aging chart
-    total = total_receivable or 1  # Avoid division by zero
-    current_percentage = (current_receivable / total) * 100
-    days_1_30_percentage = (days_1_30 / total) * 100
-    days_31_60_percentage = (days_31_60 / total) * 100
-    days_61_90_percentage = (days_61_90 / total) * 100
-    days_over_90_percentage = (days_over_90 / total) * 100
-    
-    # Count customers with balance
-    customers_with_balance = sum(1 for data in customer_balances.values() if data['total_due'] > 0)
-    
-    # Calculate overdue receivable
-    overdue_receivable = days_1_30 + days_31_60 + days_61_90 + days_over_90
-    
-    return render_template('reports/accounts_receivable.html',
-                           customer_balances=customer_balances,
-                           outstanding_orders=outstanding_orders,
-                           total_receivable=total_receivable,
-                           current_receivable=current_receivable,
-                           days_1_30=days_1_30,
-                           days_31_60=days_31_60,
-                           days_61_90=days_61_90,
-                           days_over_90=days_over_90,
-                           current_percentage=current_percentage,
-                           days_1_30_percentage=days_1_30_percentage,
-                           days_31_60_percentage=days_31_60_percentage,
-                           days_61_90_percentage=days_61_90_percentage,
-                           days_over_90_percentage=days_over_90_percentage,
-                           customers_with_balance=customers_with_balance,
-                           overdue_receivable=overdue_receivable)
+    report = receivables_report(include_zero_balance=include_zero_balance)
+    return render_template('reports/accounts_receivable.html', **report)
 
 @app.route('/api/send-payment-reminder', methods=['POST'])
 @login_required
@@ -4307,9 +4339,29 @@ def process_order_pickup(order_id):
     if print_receipt:
         # Generate a receipt PDF with the signature
         try:
-            receipt_file = generate_pickup_receipt(order)
+            receipt_pdf = generate_pickup_receipt(order)
+            with receipt_pdf:
+                blob = acquire_blob(nextcloud, receipt_pdf, '.pdf')
+            if not blob:
+                raise Exception('Failed to upload receipt to Nextcloud')
+            
+            # Store the receipt with the order's files
+            receipt_file = OrderFile(
+                order_id=order.id,
+                filename=os.path.basename(blob.file_path),
+                original_filename=f"receipt_{order.order_number}.pdf",
+                file_type='receipt',
+                file_path=blob.file_path,
+                file_size=blob.file_size,
+                content_hash=blob.content_hash,
+                blob=blob,
+                uploaded_by=current_user.id
+            )
+            db.session.add(receipt_file)
+            db.session.commit()
             flash(f'Receipt generated successfully. <a href="{url_for("files_download", file_id=receipt_file.id)}" class="alert-link">Download Receipt</a>', 'success')
         except Exception as e:
+            db.session.rollback()
             app.logger.error(f"Error generating receipt: {str(e)}")
             flash(f'Error generating receipt: {str(e)}', 'warning')
     
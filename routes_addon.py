@@ -1,9 +1,12 @@
 # Import required modules
-import io
-import qrcode
+import hashlib
 from flask import request, Response, render_template
 from app import app
 from models import Order
+from pdf_generator import qr_code_png
+
+# A tracking code never changes once created, so its QR image can be cached for a year
+QR_CODE_MAX_AGE = 365 * 24 * 60 * 60
 
 # Order QR Code generation
 @app.route('/order/qrcode/<int:order_id>')
@@ -18,24 +21,14 @@ def order_qr_code(order_id):
     base_url = request.host_url.rstrip('/')
     tracking_url = f"{base_url}/track/{tracking_code}"
     
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(tracking_url)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to bytes
-    img_io = io.BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
+    # Generate QR code; the ETag covers the host as well as the tracking code
+    response = Response(qr_code_png(tracking_url), mimetype='image/png')
+    response.set_etag(hashlib.sha256(tracking_url.encode()).hexdigest()[:32])
+    response.cache_control.public = True
+    response.cache_control.max_age = QR_CODE_MAX_AGE
+    response.cache_control.immutable = True
     
-    return Response(img_io, mimetype='image/png')
+    return response.make_conditional(request)
 
 # Order tracking page
 @app.route('/track/<tracking_code>')
@@ -1,7 +1,7 @@
 from flask import render_template, jsonify, request
 from flask_wtf import FlaskForm
-from app import app, db, csrf
-from models import PaperOption, PrintPricing, FinishingOption
+from app import app, csrf
+from price_book import get_price_book, finishing_price
 
 
 @app.route('/print-preview', methods=['GET'])
@@ -13,25 +13,18 @@ def print_preview():
     
     form = PreviewForm()
     
-    # Get all paper sizes for the dropdown
-    paper_sizes = db.session.query(PaperOption.size).distinct().all()
-    sizes = sorted([size[0] for size in paper_sizes if size[0]])
+    book = get_price_book()
     
-    # Get all paper weights for the dropdown
-    paper_weights = db.session.query(PaperOption.weight).distinct().all()
-    weights = sorted([weight[0] for weight in paper_weights if weight[0]])
-    
-    # Get all paper categories for the dropdown
-    paper_categories = db.session.query(PaperOption.category).distinct().all()
-    categories = sorted([category[0] for category in paper_categories if category[0]])
+    # Get all paper sizes, weights and categories for the dropdowns
+    sizes = book.distinct_values(book.paper_options, 'size')
+    weights = book.distinct_values(book.paper_options, 'weight')
+    categories = book.distinct_values(book.paper_options, 'category')
     
     # Get all color types for the dropdown
-    color_types = db.session.query(PrintPricing.color_type).distinct().all()
-    color_options = sorted([color[0] for color in color_types if color[0]])
+    color_options = book.distinct_values(book.print_pricing, 'color_type')
     
     # Get all finishing options categories
-    finishing_categories = db.session.query(FinishingOption.category).distinct().all()
-    finishing_categories = sorted([cat[0] for cat in finishing_categories if cat[0]])
+    finishing_categories = book.distinct_values(book.finishing_options, 'category')
     
     return render_template(
         'print_preview/index.html',
@@ -44,75 +37,83 @@ def print_preview():
     )
 
 
-@app.route('/api/preview/cost-estimate', methods=['POST'])
-def api_preview_cost_estimate():
-    """API endpoint to get real-time cost estimation for a print job"""
-    data = request.json
+# Upper bounds for a single batch pricing request
+BATCH_MAX_JOBS = 200
+BATCH_MAX_QUANTITIES = 50
+
+
+class PricingError(Exception):
+    """A job spec that cannot be priced, with the HTTP status to report"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _resolve_job(book, spec):
+    """
+    Resolve a job spec to its paper, print pricing and finishing options
     
-    # Extract parameters
-    paper_id = data.get('paper_id')
-    color_type = data.get('color_type') 
-    sides = data.get('sides', 'Single-sided')
-    quantity = int(data.get('quantity', 1))
-    finishing_ids = data.get('finishing_ids', [])
+    Args:
+        book: PriceBook to price from
+        spec: dict with paper_id, color_type, sides and finishing_ids
     
-    # Validate parameters
+    Returns:
+        dict of the resolved rows and the per-unit price and cost
+    """
+    paper_id = spec.get('paper_id')
+    color_type = spec.get('color_type')
     if not paper_id or not color_type:
-        return jsonify({'error': 'Missing required parameters'}), 400
+        raise PricingError('Missing required parameters')
     
-    try:
-        # Get paper info
-        paper = PaperOption.query.get(paper_id)
-        if not paper:
-            return jsonify({'error': 'Paper option not found'}), 404
-            
-        # Get print pricing
-        pricing = PrintPricing.query.filter_by(
-            paper_size=paper.size, 
-            color_type=color_type
-        ).first()
-        
-        if not pricing:
-            # Try to find a generic pricing
-            pricing = PrintPricing.query.filter_by(
-                color_type=color_type
-            ).filter(PrintPricing.paper_size.in_(['Any', 'Universal'])).first()
-            
-        if not pricing:
-            return jsonify({'error': 'Print pricing not found for this combination'}), 404
-            
-        # Calculate base price
-        num_sides = 2 if sides == 'Double-sided' else 1
-        paper_cost = paper.price_per_sheet
-        paper_cost_price = paper.cost_per_sheet
-        printing_cost = pricing.price_per_side * num_sides
-        printing_cost_price = pricing.cost_per_side * num_sides
-        
-        unit_price = paper_cost + printing_cost
-        unit_cost = paper_cost_price + printing_cost_price
-        
-        # Add finishing options pricing
-        finishing_cost = 0
-        finishing_cost_breakdown = []
-        
-        if finishing_ids:
-            for finishing_id in finishing_ids:
-                option = FinishingOption.query.get(finishing_id)
-                if option:
-                    # Calculate effective cost based on quantity
-                    option_price = option.base_price
-                    if option.price_per_piece > 0:
-                        option_price += option.price_per_piece * quantity
-                        
-                    # Apply minimum price if set
-                    if option.minimum_price > 0:
-                        option_price = max(option_price, option.minimum_price)
-                        
-                    finishing_cost += option_price
-                    finishing_cost_breakdown.append({
-                        'name': option.name,
-                        'price': option_price
-                    })
+    # Get paper info
+    paper = book.paper(int(paper_id))
+    if not paper:
+        raise PricingError('Paper option not found', 404)
+    
+    # Get print pricing, falling back to a generic size
+    pricing = book.find_print_pricing(paper.size, color_type)
+    if not pricing:
+        raise PricingError('Print pricing not found for this combination', 404)
+    
+    sides = spec.get('sides', 'Single-sided')
+    num_sides = 2 if sides == 'Double-sided' else 1
+    finishing_options = [book.finishing_option(int(finishing_id)) for finishing_id in spec.get('finishing_ids') or []]
+    
+    return {
+        'paper': paper,
+        'pricing': pricing,
+        'sides': sides,
+        'num_sides': num_sides,
+        'unit_price': paper.price_per_sheet + pricing.price_per_side * num_sides,
+        'unit_cost': paper.cost_per_sheet + pricing.cost_per_side * num_sides,
+        'finishing_options': [option for option in finishing_options if option],
+    }
+
+
+def _estimate_quantities(job, quantities):
+    """
+    Price a resolved job at every quantity in one pass
+    
+    Returns:
+        list of cost estimates, one per quantity, in the cost-estimate format
+    """
+    paper = job['paper']
+    pricing = job['pricing']
+    unit_price = job['unit_price']
+    unit_cost = job['unit_cost']
+    
+    # Finishing prices for every option across all quantities
+    finishing_prices = [
+        (option.name, [finishing_price(option, quantity) for quantity in quantities])
+        for option in job['finishing_options']
+    ]
+    
+    estimates = []
+    for index, quantity in enumerate(quantities):
+        finishing_cost_breakdown = [
+            {'name': name, 'price': prices[index]} for name, prices in finishing_prices
+        ]
+        finishing_cost = sum(entry['price'] for entry in finishing_cost_breakdown)
         
         # Calculate final prices
         total_unit_price = unit_price + (finishing_cost / max(1, quantity))
@@ -121,8 +122,7 @@ def api_preview_cost_estimate():
         estimated_profit = total_price - total_cost
         profit_margin = (estimated_profit / total_price) * 100 if total_price > 0 else 0
         
-        # Format result
-        result = {
+        estimates.append({
             'paper': {
                 'name': paper.name,
                 'category': paper.category,
@@ -135,8 +135,8 @@ def api_preview_cost_estimate():
                 'price_per_side': pricing.price_per_side,
                 'cost_per_side': pricing.cost_per_side,
                 'color_type': pricing.color_type,
-                'sides': sides,
-                'num_sides': num_sides
+                'sides': job['sides'],
+                'num_sides': job['num_sides']
             },
             'finishing': {
                 'total_cost': finishing_cost,
@@ -154,9 +154,61 @@ def api_preview_cost_estimate():
                 'profit_margin': round(profit_margin, 2)
             },
             'quantity': quantity
-        }
-        
-        return jsonify(result)
-        
+        })
+    return estimates
+
+
+@app.route('/api/preview/cost-estimate', methods=['POST'])
+def api_preview_cost_estimate():
+    """API endpoint to get real-time cost estimation for a print job"""
+    data = request.json
+    quantity = int(data.get('quantity', 1))
+    
+    try:
+        job = _resolve_job(get_price_book(), data)
+        return jsonify(_estimate_quantities(job, [quantity])[0])
+    except PricingError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/preview/cost-estimate/batch', methods=['POST'])
+def api_preview_cost_estimate_batch():
+    """
+    Price many jobs, each at one or more quantities, in a single request
+    
+    The body is {"jobs": [...], "quantities": [...]}. Each job takes the same
+    fields as /api/preview/cost-estimate plus an optional "quantities" list;
+    jobs without one are priced at the top-level quantities, or their own
+    "quantity". A job that cannot be priced gets an "error" entry instead of
+    failing the whole batch.
+    """
+    data = request.get_json(silent=True) or {}
+    jobs = data.get('jobs')
+    default_quantities = data.get('quantities')
+    
+    if not isinstance(jobs, list) or not jobs:
+        return jsonify({'error': 'jobs must be a non-empty list'}), 400
+    if len(jobs) > BATCH_MAX_JOBS:
+        return jsonify({'error': f'At most {BATCH_MAX_JOBS} jobs per request'}), 400
+    
+    book = get_price_book()
+    results = []
+    for index, spec in enumerate(jobs):
+        try:
+            if not isinstance(spec, dict):
+                raise PricingError('Job must be an object')
+            quantities = spec.get('quantities') or default_quantities or [spec.get('quantity', 1)]
+            if not isinstance(quantities, list) or len(quantities) > BATCH_MAX_QUANTITIES:
+                raise PricingError(f'quantities must be a list of at most {BATCH_MAX_QUANTITIES} values')
+            quantities = [int(quantity) for quantity in quantities]
+            
+            job = _resolve_job(book, spec)
+            results.append({'index': index, 'estimates': _estimate_quantities(job, quantities)})
+        except PricingError as e:
+            results.append({'index': index, 'error': str(e), 'status': e.status})
+        except (TypeError, ValueError) as e:
+            results.append({'index': index, 'error': str(e), 'status': 400})
+    
+    return jsonify({'jobs': results, 'pricing_version': book.version})
@@ -0,0 +1,86 @@
+// Batch printing of job tickets from the orders page
+
+/**
+ * Starts a batch print job from the Batch Print dialog, shows its progress
+ * by polling the job's status URL, and downloads the merged PDF once the
+ * job is done.
+ */
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('batchPrintForm');
+    if (!form) {
+        return;
+    }
+
+    const submitButton = document.getElementById('batchPrintSubmit');
+    const progress = document.getElementById('batchPrintProgress');
+    const progressBar = progress.querySelector('.progress-bar');
+    const progressText = document.getElementById('batchPrintProgressText');
+    const errorBox = document.getElementById('batchPrintError');
+
+    // Milliseconds between status checks
+    const POLL_INTERVAL = 1000;
+
+    form.addEventListener('submit', function(event) {
+        event.preventDefault();
+        submitButton.disabled = true;
+        errorBox.classList.add('d-none');
+        showProgress(0, 0, 'Starting...');
+
+        fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            credentials: 'same-origin'
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error || 'Could not start the batch print');
+                }
+                showProgress(0, data.total, 'Queued');
+                poll(data.status_url);
+            })
+            .catch(fail);
+    });
+
+    /**
+     * Check the job's status until it is done or has failed
+     */
+    function poll(statusUrl) {
+        fetch(statusUrl, { credentials: 'same-origin' })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Batch print job was lost: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(job => {
+                if (job.state === 'failed') {
+                    throw new Error('Batch print failed: ' + job.error);
+                }
+                if (job.state === 'done') {
+                    showProgress(job.total, job.total, 'Done, downloading ' + job.total + ' orders');
+                    submitButton.disabled = false;
+                    window.location = job.download_url;
+                    return;
+                }
+                const label = job.state === 'queued' ? 'Waiting for another batch to finish' : job.done + ' of ' + job.total + ' orders';
+                showProgress(job.done, job.total, label);
+                setTimeout(() => poll(statusUrl), POLL_INTERVAL);
+            })
+            .catch(fail);
+    }
+
+    function showProgress(done, total, label) {
+        progress.classList.remove('d-none');
+        progressBar.style.width = (total ? Math.round(100 * done / total) : 0) + '%';
+        progressText.textContent = label;
+    }
+
+    function fail(error) {
+        console.error(error);
+        progress.classList.add('d-none');
+        errorBox.textContent = error.message;
+        errorBox.classList.remove('d-none');
+        submitButton.disabled = false;
+    }
+});
@@ -0,0 +1,134 @@
+// Infinite scrolling for the order list
+
+/**
+ * Appends the next page of orders from /api/orders when the "Load More"
+ * button scrolls into view (or is clicked), using the keyset cursor
+ * returned by the previous page.
+ */
+document.addEventListener('DOMContentLoaded', function() {
+    const loadMoreButton = document.getElementById('load-more-orders');
+    const tableBody = document.getElementById('orders-table-body');
+    
+    if (!loadMoreButton || !tableBody) {
+        // Everything fits on one page
+        return;
+    }
+    
+    let loading = false;
+    
+    loadMoreButton.addEventListener('click', loadNextPage);
+    
+    // Load automatically when the button becomes visible
+    if ('IntersectionObserver' in window) {
+        const observer = new IntersectionObserver(function(entries) {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        });
+        observer.observe(loadMoreButton);
+    }
+    
+    /**
+     * Fetch the next page and append its rows to the table
+     */
+    function loadNextPage() {
+        const cursor = loadMoreButton.dataset.nextCursor;
+        if (loading || !cursor) {
+            return;
+        }
+        loading = true;
+        loadMoreButton.disabled = true;
+        
+        const url = new URL(loadMoreButton.dataset.apiUrl, window.location.origin);
+        url.searchParams.set('cursor', cursor);
+        
+        fetch(url, { credentials: 'same-origin' })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to load orders: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(data => {
+                data.orders.forEach(order => tableBody.appendChild(buildRow(order)));
+                
+                if (data.next_cursor) {
+                    loadMoreButton.dataset.nextCursor = data.next_cursor;
+                    loadMoreButton.disabled = false;
+                } else {
+                    loadMoreButton.closest('.card-footer').remove();
+                }
+            })
+            .catch(error => {
+                console.error(error);
+                loadMoreButton.disabled = false;
+            })
+            .finally(() => {
+                loading = false;
+            });
+    }
+    
+    /**
+     * Build a table row matching the server-rendered markup
+     */
+    function buildRow(order) {
+        const row = document.createElement('tr');
+        
+        row.appendChild(textCell(order.order_number));
+        row.appendChild(textCell(order.customer_name));
+        row.appendChild(textCell(order.title));
+        
+        const dueCell = document.createElement('td');
+        if (order.due_date) {
+            dueCell.textContent = order.due_date;
+        } else {
+            const na = document.createElement('span');
+            na.className = 'text-muted';
+            na.textContent = 'N/A';
+            dueCell.appendChild(na);
+        }
+        row.appendChild(dueCell);
+        
+        const statusCell = document.createElement('td');
+        const badge = document.createElement('span');
+        badge.className = 'badge badge-' + order.status;
+        badge.id = 'order-status-' + order.id;
+        badge.textContent = order.status;
+        statusCell.appendChild(badge);
+        row.appendChild(statusCell);
+        
+        row.appendChild(textCell(order.created_at));
+        row.appendChild(textCell('$' + order.total_price.toFixed(2)));
+        
+        const actionsCell = document.createElement('td');
+        const group = document.createElement('div');
+        group.className = 'btn-group btn-group-sm';
+        group.appendChild(actionLink(order.view_url, 'btn-outline-primary', 'bi-eye'));
+        group.appendChild(actionLink(order.edit_url, 'btn-outline-secondary', 'bi-pencil'));
+        group.appendChild(actionLink(order.order_form_url, 'btn-outline-info', 'bi-file-earmark-pdf', 'Generate Order Form'));
+        group.appendChild(actionLink(order.pull_sheet_url, 'btn-outline-success', 'bi-list-check', 'Generate Pull Sheet'));
+        actionsCell.appendChild(group);
+        row.appendChild(actionsCell);
+        
+        return row;
+    }
+    
+    function textCell(text) {
+        const cell = document.createElement('td');
+        cell.textContent = text;
+        return cell;
+    }
+    
+    function actionLink(href, buttonClass, iconClass, title) {
+        const link = document.createElement('a');
+        link.href = href;
+        link.className = 'btn ' + buttonClass;
+        if (title) {
+            link.title = title;
+        }
+        const icon = document.createElement('i');
+        icon.className = 'bi ' + iconClass;
+        link.appendChild(icon);
+        return link;
+    }
+});
@@ -0,0 +1,442 @@
+"""
+Local WebDAV stand-in for Nextcloud
+
+Serves the parts of Nextcloud's WebDAV API that NextcloudClient uses
+(PROPFIND, MKCOL, PUT, GET with ranges, DELETE, MOVE and chunked upload v2)
+from a temporary directory, so the client can be exercised and benchmarked
+without a live server. Latency and random failures can be injected.
+
+In-process use:
+
+    with WebDAVStandIn(latency=0.02, failure_rate=0.1) as server:
+        client = server.client()
+        client.upload_file(BytesIO(b'data'), 'ORD-1/a.pdf')
+
+Standalone, for the Nextcloud diagnostic scripts:
+
+    python webdav_standin.py --port 8080
+    NEXTCLOUD_URL=http://127.0.0.1:8080 NEXTCLOUD_USERNAME=admin NEXTCLOUD_PASSWORD=admin python test_nextcloud_connection.py
+"""
+import os
+import re
+import time
+import random
+import shutil
+import base64
+import argparse
+import tempfile
+import threading
+import mimetypes
+import http.server
+import socketserver
+from collections import Counter
+from email.utils import formatdate
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import escape
+
+DAV_PREFIX = '/remote.php/dav/'
+READ_BLOCK_SIZE = 256 * 1024
+
+# Methods that can be failed by failure_rate unless failure_methods is given
+DEFAULT_FAILURE_METHODS = ('PROPFIND', 'MKCOL', 'PUT', 'GET', 'DELETE', 'MOVE')
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def standin(self):
+        return self.server.standin
+
+    # Request plumbing
+
+    def _read_body(self):
+        """Read the request body, plain or chunked"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _local_path(self, url_path):
+        """Map a DAV URL path to (namespace, path in the store), or None if outside the API"""
+        path = unquote(urlparse(url_path).path)
+        if not path.startswith(DAV_PREFIX):
+            return None
+        parts = path[len(DAV_PREFIX):].split('/', 2)
+        if len(parts) < 2 or parts[0] not in ('files', 'uploads') or parts[1] != self.standin.username:
+            return None
+        relative = parts[2] if len(parts) > 2 else ''
+        if '..' in relative.split('/'):
+            return None
+        return parts[0], os.path.join(self.standin.root, parts[0], relative.strip('/'))
+
+    def _authorized(self):
+        expected = base64.b64encode(f"{self.standin.username}:{self.standin.password}".encode()).decode()
+        return self.headers.get('Authorization') == f"Basic {expected}"
+
+    def _dispatch(self, handler):
+        body = self._read_body() if self.command in ('PUT', 'PROPFIND', 'MKCOL', 'MOVE', 'DELETE') else b''
+        if self.standin._should_fail(self.command):
+            return self._reply(503, b'Injected failure')
+        if self.path.rstrip('/') in ('', '/status.php') or not self.path.startswith(DAV_PREFIX):
+            # Server root, used by the diagnostics to check the server is reachable
+            return self._reply(200, b'WebDAV stand-in') if self.command == 'GET' else self._reply(404)
+        if not self._authorized():
+            return self._reply(401, headers={'WWW-Authenticate': 'Basic realm="Nextcloud"'})
+        target = self._local_path(self.path)
+        if target is None:
+            return self._reply(404)
+        handler(target[1], body)
+
+    def do_PROPFIND(self):
+        self._dispatch(self._propfind)
+
+    def do_MKCOL(self):
+        self._dispatch(self._mkcol)
+
+    def do_PUT(self):
+        self._dispatch(self._put)
+
+    def do_GET(self):
+        self._dispatch(self._get)
+
+    def do_HEAD(self):
+        self._dispatch(self._get)
+
+    def do_DELETE(self):
+        self._dispatch(self._delete)
+
+    def do_MOVE(self):
+        self._dispatch(self._move)
+
+    # WebDAV methods
+
+    def _propfind(self, path, body):
+        if not os.path.exists(path):
+            return self._reply(404)
+        depth = self.headers.get('Depth', 'infinity').lower()
+        if depth == 'infinity' and self.standin.refuse_depth_infinity:
+            return self._reply(403, b'<?xml version="1.0"?><d:error xmlns:d="DAV:"><d:propfind-finite-depth/></d:error>')
+        if depth == 'infinity' and not self.standin.allow_depth_infinity:
+            # Like Nextcloud (Sabre) with infinite depth disabled, which
+            # quietly answers as if Depth: 1 was asked for
+            depth = '1'
+
+        self.send_response(207)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write(text):
+            data = text.encode()
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+        write('<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">')
+        for entry_path in self._walk(path, depth):
+            write(self._propfind_response(entry_path))
+        write('</d:multistatus>')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _walk(self, path, depth):
+        yield path
+        if depth == '0' or not os.path.isdir(path):
+            return
+        for name in sorted(os.listdir(path)):
+            child = os.path.join(path, name)
+            if depth == 'infinity':
+                yield from self._walk(child, depth)
+            else:
+                yield child
+
+    def _propfind_response(self, path):
+        namespace_root = os.path.join(self.standin.root, 'files')
+        if not path.startswith(namespace_root):
+            namespace_root = os.path.join(self.standin.root, 'uploads')
+            namespace = 'uploads'
+        else:
+            namespace = 'files'
+        relative = os.path.relpath(path, namespace_root).replace(os.sep, '/')
+        relative = '' if relative == '.' else relative
+        is_dir = os.path.isdir(path)
+        href = quote(f"{DAV_PREFIX}{namespace}/{self.standin.username}/{relative}".rstrip('/') + ('/' if is_dir else ''))
+        stat = os.stat(path)
+
+        props = [f'<d:getetag>{escape(_etag(stat))}</d:getetag>',
+                 f'<d:getlastmodified>{formatdate(stat.st_mtime, usegmt=True)}</d:getlastmodified>']
+        if is_dir:
+            props.append('<d:resourcetype><d:collection/></d:resourcetype>')
+        else:
+            props.append('<d:resourcetype/>')
+            props.append(f'<d:getcontentlength>{stat.st_size}</d:getcontentlength>')
+            props.append(f'<d:getcontenttype>{escape(_content_type(path))}</d:getcontenttype>')
+        return (f'<d:response><d:href>{escape(href)}</d:href><d:propstat><d:prop>{"".join(props)}</d:prop>'
+                f'<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>')
+
+    def _mkcol(self, path, body):
+        if os.path.exists(path):
+            return self._reply(405)
+        if not os.path.isdir(os.path.dirname(path)):
+            return self._reply(409)
+        os.mkdir(path)
+        self._reply(201)
+
+    def _put(self, path, body):
+        if os.path.isdir(path):
+            return self._reply(405)
+        if not os.path.isdir(os.path.dirname(path)):
+            return self._reply(409)
+        existed = os.path.exists(path)
+        _write_atomic(path, [body])
+        self._reply(204 if existed else 201, headers={'ETag': _etag(os.stat(path))})
+
+    def _get(self, path, body):
+        if not os.path.isfile(path):
+            return self._reply(404)
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = _etag(stat)
+        headers = {
+            'Content-Type': _content_type(path),
+            'ETag': etag,
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'Accept-Ranges': 'bytes',
+        }
+
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and (not if_range or if_range == etag):
+            match = RANGE_PATTERN.match(range_header.strip())
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    start = max(size - int(match.group(2)), 0)
+                if start >= size or start > end:
+                    headers['Content-Range'] = f'bytes */{size}'
+                    return self._reply(416, headers=headers)
+                status = 206
+                headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        length = end - start + 1 if size else 0
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while length > 0:
+                block = f.read(min(READ_BLOCK_SIZE, length))
+                if not block:
+                    break
+                self.wfile.write(block)
+                length -= len(block)
+
+    def _delete(self, path, body):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.unlink(path)
+        else:
+            return self._reply(404)
+        self._reply(204)
+
+    def _move(self, path, body):
+        destination = self._local_path(self.headers.get('Destination', ''))
+        if destination is None:
+            return self._reply(400)
+        destination = destination[1]
+        # The .file of a chunked upload is virtual, its upload folder must exist
+        is_assembly = os.path.basename(path) == '.file'
+        if not os.path.exists(os.path.dirname(path) if is_assembly else path):
+            return self._reply(404)
+        if not os.path.isdir(os.path.dirname(destination)):
+            return self._reply(409)
+        existed = os.path.exists(destination)
+        if existed and self.headers.get('Overwrite', 'T').upper() == 'F':
+            return self._reply(412)
+
+        if is_assembly:
+            # Chunked upload v2: join the chunks in name order into the destination
+            upload_dir = os.path.dirname(path)
+            chunks = sorted(name for name in os.listdir(upload_dir) if name != '.file')
+            total = sum(os.path.getsize(os.path.join(upload_dir, name)) for name in chunks)
+            expected = self.headers.get('OC-Total-Length')
+            if expected is not None and int(expected) != total:
+                return self._reply(400, b'Chunk sizes do not add up to OC-Total-Length')
+            _write_atomic(destination, (_read_file(os.path.join(upload_dir, name)) for name in chunks))
+            shutil.rmtree(upload_dir)
+        else:
+            if os.path.isdir(destination):
+                shutil.rmtree(destination)
+            os.replace(path, destination)
+        self._reply(204 if existed else 201)
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _content_type(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_atomic(path, blocks):
+    """Write blocks to a file via a temporary name, so readers never see a partial file"""
+    temp_path = f"{path}.standin-{threading.get_ident()}"
+    with open(temp_path, 'wb') as f:
+        for block in blocks:
+            f.write(block)
+    os.replace(temp_path, path)
+
+
+class WebDAVStandIn:
+    """
+    In-process WebDAV server standing in for Nextcloud
+
+    Args:
+        root: Directory to store files in; a temporary directory by default
+        username, password: Basic auth credentials the server accepts
+        latency: Seconds added to every request
+        failure_rate: Probability (0-1) that a request fails with 503
+        failure_methods: HTTP methods failure_rate applies to
+        allow_depth_infinity: Whether PROPFIND with Depth: infinity lists the
+            whole tree; if not, it is answered as Depth: 1, as Nextcloud does
+        refuse_depth_infinity: Refuse PROPFIND with Depth: infinity with a 403,
+            as some proxies in front of Nextcloud do
+        seed: Random seed for reproducible failure injection
+    """
+
+    def __init__(self, root=None, username='admin', password='admin', host='127.0.0.1', port=0,
+                 latency=0.0, failure_rate=0.0, failure_methods=DEFAULT_FAILURE_METHODS,
+                 allow_depth_infinity=True, refuse_depth_infinity=False, seed=None):
+        self._temp_root = root is None
+        self.root = root or tempfile.mkdtemp(prefix='webdav-standin-')
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_methods = set(failure_methods)
+        self.allow_depth_infinity = allow_depth_infinity
+        self.refuse_depth_infinity = refuse_depth_infinity
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        for namespace in ('files', 'uploads'):
+            os.makedirs(os.path.join(self.root, namespace), exist_ok=True)
+
+        self._server = _Server((host, port), _Handler)
+        self._server.standin = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and remove the temporary store"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._temp_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client(self, root_folder='print_orders', **kwargs):
+        """A NextcloudClient pointed at this server"""
+        from nextcloud_client import NextcloudClient
+        return NextcloudClient(self.url, self.username, self.password, root_folder, **kwargs)
+
+    def file_path(self, path):
+        """Local path of a file stored under the files namespace"""
+        return os.path.join(self.root, 'files', path.strip('/'))
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+
+    def _should_fail(self, method):
+        """Count a request, apply the latency and decide whether to fail it"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.stats[method] += 1
+            fail = method in self.failure_methods and self._random.random() < self.failure_rate
+            if fail:
+                self.stats['failed'] += 1
+        return fail
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a local WebDAV stand-in for Nextcloud')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--root', help='Directory to store files in (default: a temporary directory)')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Probability that a request fails with 503')
+    parser.add_argument('--no-depth-infinity', action='store_true', help='Answer PROPFIND with Depth: infinity as Depth: 1, like Nextcloud with infinite depth disabled')
+    parser.add_argument('--refuse-depth-infinity', action='store_true', help='Refuse PROPFIND with Depth: infinity with a 403, like some proxies')
+    args = parser.parse_args()
+
+    server = WebDAVStandIn(args.root, args.username, args.password, args.host, args.port,
+                           latency=args.latency, failure_rate=args.failure_rate,
+                           allow_depth_infinity=not args.no_depth_infinity,
+                           refuse_depth_infinity=args.refuse_depth_infinity)
+    print(f"WebDAV stand-in serving {server.root} at {server.url}")
+    print(f"NEXTCLOUD_URL={server.url} NEXTCLOUD_USERNAME={args.username} NEXTCLOUD_PASSWORD={args.password}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()